@@ -0,0 +1,556 @@
+"""Protective rebalance execution pipeline.
+
+Keeps a recent blockhash and a rolling priority-fee estimate warm in the
+background, so that when a position needs protecting the transaction can be
+built, simulated at several fee levels and sent without waiting on either.
+Point SOLANA_RPC_URL at a local solana-test-validator to exercise it offline.
+"""
+
+import asyncio
+import base64
+import os
+import time
+from collections.abc import Coroutine
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+from solders.address_lookup_table_account import (
+    AddressLookupTable,
+    AddressLookupTableAccount,
+)
+from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price
+from solders.hash import Hash
+from solders.instruction import AccountMeta, Instruction
+from solders.keypair import Keypair
+from solders.message import MessageV0
+from solders.pubkey import Pubkey
+from solders.signature import Signature
+from solders.transaction import VersionedTransaction
+
+from models import Position, RiskLevel
+from solana_client import TOKEN_MINTS, rpc_call
+
+JUPITER_API = "https://quote-api.jup.ag/v6"
+
+# Stablecoins carry 6 decimals, so USD amounts map directly to base units.
+STABLECOIN_MINTS = {TOKEN_MINTS["USDC"], TOKEN_MINTS["USDT"]}
+STABLECOIN_DECIMALS = 6
+
+COMPUTE_UNIT_LIMIT = 400_000
+MIN_PRIORITY_FEE = 1_000  # micro-lamports per compute unit
+FEE_PERCENTILES = (50, 75, 95)
+# Multiplier applied when a percentile collapses onto the level below it
+# (e.g. an idle window at the floor), so every percentile is a distinct candidate.
+FEE_LEVEL_STEP = 2
+# getRecentPrioritizationFees accepts at most 128 accounts.
+MAX_FEE_ACCOUNTS = 128
+
+# Blockhashes expire after ~150 slots (~60s); refresh well inside that.
+BLOCKHASH_REFRESH_SECONDS = 2.0
+BLOCKHASH_MAX_AGE_SECONDS = 30.0
+FEE_REFRESH_SECONDS = 10.0
+FEE_WINDOW_SLOTS = 300
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+# ---------------------------------------------------------------------------
+# Background caches
+# ---------------------------------------------------------------------------
+
+class BlockhashCache:
+    """Recent blockhash refreshed in the background."""
+
+    def __init__(self, rpc_url: str, client: httpx.AsyncClient):
+        self.rpc_url = rpc_url
+        self.client = client
+        self._blockhash: Hash | None = None
+        self._fetched_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def refresh(self) -> None:
+        result = await rpc_call(
+            self.rpc_url,
+            "getLatestBlockhash",
+            [{"commitment": "confirmed"}],
+            client=self.client,
+        )
+        self._blockhash = Hash.from_string(result["result"]["value"]["blockhash"])
+        self._fetched_at = time.monotonic()
+
+    async def get(self) -> Hash:
+        """Return the cached blockhash, fetching inline only if it went stale."""
+        if (
+            self._blockhash is None
+            or time.monotonic() - self._fetched_at > BLOCKHASH_MAX_AGE_SECONDS
+        ):
+            await self.refresh()
+        return self._blockhash
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                pass  # keep the last good hash; the next tick retries
+            await asyncio.sleep(BLOCKHASH_REFRESH_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class PriorityFeeEstimator:
+    """Rolling window of ``getRecentPrioritizationFees`` samples.
+
+    Samples are keyed by slot so overlapping responses do not double count;
+    only the most recent ``FEE_WINDOW_SLOTS`` slots are kept. Without
+    ``accounts`` the RPC reports network-wide minimums (mostly zero), so the
+    pipeline points the estimator at the writable accounts it actually locks.
+    """
+
+    def __init__(
+        self,
+        rpc_url: str,
+        client: httpx.AsyncClient,
+        accounts: list[str] | None = None,
+    ):
+        self.rpc_url = rpc_url
+        self.client = client
+        self.accounts = (accounts or [])[:MAX_FEE_ACCOUNTS]
+        self._fees: dict[int, int] = {}
+        self._window_stale = False
+        self._task: asyncio.Task | None = None
+
+    def track(self, accounts: list[str]) -> None:
+        """Sample fees for ``accounts`` from the next refresh on."""
+        accounts = accounts[:MAX_FEE_ACCOUNTS]
+        if accounts != self.accounts:
+            self.accounts = accounts
+            self._window_stale = True
+
+    async def sample(self, accounts: list[str]) -> None:
+        """Track ``accounts``, sampling them now if they are not already tracked.
+
+        A failed sample leaves the window stale, so ``candidates`` falls back
+        to the floor levels rather than fees sampled for other accounts.
+        """
+        self.track(accounts)
+        if self._window_stale:
+            try:
+                await self.refresh()
+            except Exception:
+                pass  # the background tick retries
+
+    async def refresh(self) -> None:
+        accounts = self.accounts
+        result = await rpc_call(
+            self.rpc_url,
+            "getRecentPrioritizationFees",
+            [accounts] if accounts else [],
+            client=self.client,
+        )
+        if accounts is not self.accounts:
+            return  # tracked accounts changed mid-flight; the next tick resamples
+        if self._window_stale:
+            self._fees.clear()
+            self._window_stale = False
+        for sample in result.get("result", []):
+            self._fees[sample["slot"]] = sample["prioritizationFee"]
+        if len(self._fees) > FEE_WINDOW_SLOTS:
+            for slot in sorted(self._fees)[: len(self._fees) - FEE_WINDOW_SLOTS]:
+                del self._fees[slot]
+
+    def candidates(self) -> list[int]:
+        """One strictly increasing fee level (micro-lamports/CU) per percentile."""
+        fees = [] if self._window_stale else sorted(self._fees.values())
+        levels: list[int] = []
+        for pct in FEE_PERCENTILES:
+            fee = fees[min(len(fees) - 1, len(fees) * pct // 100)] if fees else 0
+            fee = max(fee, MIN_PRIORITY_FEE)
+            if levels and fee <= levels[-1]:
+                fee = levels[-1] * FEE_LEVEL_STEP
+            levels.append(fee)
+        return levels
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                pass  # keep the existing window; the next tick retries
+            await asyncio.sleep(FEE_REFRESH_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# ---------------------------------------------------------------------------
+# Rebalance planning
+# ---------------------------------------------------------------------------
+
+def _mint(token: str) -> str:
+    """Mint address for a TOKEN_MINTS symbol or a base58 mint address."""
+    if token in TOKEN_MINTS:
+        return TOKEN_MINTS[token]
+    try:
+        Pubkey.from_string(token)
+    except ValueError:
+        raise ValueError(f"Unknown token: {token}") from None
+    return token
+
+
+@dataclass
+class RebalancePlan:
+    wallet: str
+    protocol: str
+    action: str
+    input_mint: str
+    output_mint: str
+    amount: int  # base units of the stablecoin leg
+    swap_mode: str  # "ExactIn" or "ExactOut"
+    urgent: bool
+    account: str | None = None  # the position's obligation / margin account
+
+
+def plan_rebalance(position: Position, action: str, amount_usd: float) -> RebalancePlan:
+    """Translate a USD rebalance request into a Jupiter swap for ``position``.
+
+    ``add_collateral`` swaps USDC into the first collateral token;
+    ``repay_debt`` swaps the first collateral token into exactly
+    ``amount_usd`` of the (stablecoin) debt token. Tokens may be symbols
+    from TOKEN_MINTS or mint addresses, as reported for unlisted mints.
+    Demo positions (shown when the RPC fetch failed) and unpriced positions
+    are refused.
+    """
+    if position.demo:
+        raise ValueError(
+            f"{position.protocol} position is demo data (RPC fetch failed); refusing to rebalance"
+        )
+    if not position.priced:
+        raise ValueError(
+            f"{position.protocol} position is unpriced (no oracle prices); refusing to rebalance"
+        )
+    collateral = _mint((position.tokens_collateral or ["SOL"])[0])
+    debt = _mint((position.tokens_debt or ["USDC"])[0])
+    amount = int(amount_usd * 10**STABLECOIN_DECIMALS)
+
+    if action == "add_collateral":
+        input_mint, output_mint, swap_mode = TOKEN_MINTS["USDC"], collateral, "ExactIn"
+    elif action == "repay_debt":
+        if debt not in STABLECOIN_MINTS:
+            raise ValueError(f"repay_debt needs a stablecoin debt leg, got {debt}")
+        input_mint, output_mint, swap_mode = collateral, debt, "ExactOut"
+    else:
+        raise ValueError(f"Unsupported action: {action}")
+
+    return RebalancePlan(
+        wallet=position.wallet,
+        protocol=position.protocol,
+        action=action,
+        input_mint=input_mint,
+        output_mint=output_mint,
+        amount=amount,
+        swap_mode=swap_mode,
+        urgent=position.risk_level == RiskLevel.EMERGENCY,
+        account=position.account,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Execution pipeline
+# ---------------------------------------------------------------------------
+
+def _instruction_from_json(ix: dict[str, Any]) -> Instruction:
+    """Convert a Jupiter swap-instructions entry into a solders Instruction."""
+    return Instruction(
+        Pubkey.from_string(ix["programId"]),
+        base64.b64decode(ix["data"]),
+        [
+            AccountMeta(
+                Pubkey.from_string(meta["pubkey"]),
+                meta["isSigner"],
+                meta["isWritable"],
+            )
+            for meta in ix["accounts"]
+        ],
+    )
+
+
+def _writable_accounts(instructions: list[Instruction], payer: Pubkey) -> list[str]:
+    """Writable accounts (other than the payer) whose locks set the fee market."""
+    keys = dict.fromkeys(
+        str(meta.pubkey)
+        for ix in instructions
+        for meta in ix.accounts
+        if meta.is_writable and meta.pubkey != payer
+    )
+    return list(keys)
+
+
+def load_signer() -> Keypair | None:
+    """Load the signing keypair from SOLANA_KEYPAIR_PATH (solana-keygen JSON)."""
+    path = os.environ.get("SOLANA_KEYPAIR_PATH")
+    if not path:
+        return None
+    with open(path) as f:
+        return Keypair.from_json(f.read())
+
+
+class RebalancePipeline:
+    """Builds, simulates and (in live mode) sends protective rebalances."""
+
+    def __init__(
+        self,
+        rpc_url: str,
+        signer: Keypair | None = None,
+        live: bool = False,
+        client: httpx.AsyncClient | None = None,
+    ):
+        self.rpc_url = rpc_url
+        self.signer = signer
+        self.live = live
+        self.client = client or httpx.AsyncClient(timeout=10)
+        self.blockhashes = BlockhashCache(rpc_url, self.client)
+        self.fees = PriorityFeeEstimator(rpc_url, self.client)
+        self._lookup_tables: dict[str, AddressLookupTableAccount] = {}
+
+    async def start(self) -> None:
+        """Warm both caches once, then keep them refreshing in the background."""
+        await asyncio.gather(
+            self.blockhashes.refresh(), self.fees.refresh(), return_exceptions=True
+        )
+        self.blockhashes.start()
+        self.fees.start()
+
+    async def close(self) -> None:
+        self.blockhashes.stop()
+        self.fees.stop()
+        await self.client.aclose()
+
+    async def _jupiter_instructions(
+        self, plan: RebalancePlan
+    ) -> tuple[list[Instruction], list[str]]:
+        resp = await self.client.get(
+            f"{JUPITER_API}/quote",
+            params={
+                "inputMint": plan.input_mint,
+                "outputMint": plan.output_mint,
+                "amount": str(plan.amount),
+                "swapMode": plan.swap_mode,
+                "slippageBps": "50",
+            },
+        )
+        quote = resp.json()
+        resp = await self.client.post(
+            f"{JUPITER_API}/swap-instructions",
+            json={"quoteResponse": quote, "userPublicKey": plan.wallet},
+        )
+        body = resp.json()
+        if "error" in body:
+            raise RuntimeError(f"Jupiter: {body['error']}")
+        # Compute budget instructions are dropped: each candidate sets its own.
+        raw = [
+            *body.get("setupInstructions", []),
+            body["swapInstruction"],
+            *([body["cleanupInstruction"]] if body.get("cleanupInstruction") else []),
+        ]
+        return [_instruction_from_json(ix) for ix in raw], body.get(
+            "addressLookupTableAddresses", []
+        )
+
+    async def _lookup_table_accounts(
+        self, addresses: list[str]
+    ) -> list[AddressLookupTableAccount]:
+        """Resolve lookup tables, fetching only ones not seen before."""
+        missing = [a for a in addresses if a not in self._lookup_tables]
+        if missing:
+            result = await rpc_call(
+                self.rpc_url,
+                "getMultipleAccounts",
+                [missing, {"encoding": "base64"}],
+                client=self.client,
+            )
+            for address, account in zip(missing, result["result"]["value"]):
+                if account is None:
+                    continue
+                table = AddressLookupTable.deserialize(
+                    base64.b64decode(account["data"][0])
+                )
+                self._lookup_tables[address] = AddressLookupTableAccount(
+                    Pubkey.from_string(address), table.addresses
+                )
+        return [self._lookup_tables[a] for a in addresses if a in self._lookup_tables]
+
+    def _build(
+        self,
+        payer: Pubkey,
+        instructions: list[Instruction],
+        lookup_tables: list[AddressLookupTableAccount],
+        blockhash: Hash,
+        priority_fee: int,
+    ) -> VersionedTransaction:
+        message = MessageV0.try_compile(
+            payer,
+            [
+                set_compute_unit_limit(COMPUTE_UNIT_LIMIT),
+                set_compute_unit_price(priority_fee),
+                *instructions,
+            ],
+            lookup_tables,
+            blockhash,
+        )
+        if self.signer is not None:
+            return VersionedTransaction(message, [self.signer])
+        # Dry run: simulate with sigVerify off and a placeholder signature.
+        return VersionedTransaction.populate(message, [Signature.default()])
+
+    async def _simulate(self, tx: VersionedTransaction) -> dict[str, Any]:
+        result = await rpc_call(
+            self.rpc_url,
+            "simulateTransaction",
+            [
+                base64.b64encode(bytes(tx)).decode(),
+                {"encoding": "base64", "sigVerify": False, "commitment": "processed"},
+            ],
+            client=self.client,
+        )
+        if "error" in result:
+            return {"err": result["error"], "unitsConsumed": None}
+        return result["result"]["value"]
+
+    async def execute(
+        self,
+        plan: RebalancePlan,
+        protocol_instructions: Coroutine[Any, Any, list[Instruction]] | None = None,
+        triggered_at: float | None = None,
+    ) -> dict[str, Any]:
+        """Build, simulate and send ``plan``; returns the outcome and timings.
+
+        ``protocol_instructions`` (the repay/deposit leg) is awaited alongside
+        the Jupiter request; live mode refuses to send without it, since a
+        swap alone moves funds without protecting the position. Fees are
+        sampled for the transaction's own writable accounts: when those
+        differ from the ones already tracked, a one-shot sample runs
+        alongside the lookup-table fetch. Every fee candidate is simulated
+        concurrently; urgent plans send at the highest level that simulates
+        cleanly, the rest at the lowest.
+        """
+        started = time.perf_counter()
+        triggered_at = triggered_at if triggered_at is not None else started
+        error = None
+        if self.live and self.signer is None:
+            error = "LIVE_MODE requires SOLANA_KEYPAIR_PATH"
+        elif self.signer is not None and str(self.signer.pubkey()) != plan.wallet:
+            error = "Signer does not match the position wallet"
+        if error:
+            if protocol_instructions is not None:
+                protocol_instructions.close()
+            raise RuntimeError(error)
+
+        async def _no_instructions() -> list[Instruction]:
+            return []
+
+        (swap_ixs, table_addresses), extra_ixs, blockhash = await asyncio.gather(
+            self._jupiter_instructions(plan),
+            protocol_instructions or _no_instructions(),
+            self.blockhashes.get(),
+        )
+        if self.live and not extra_ixs:
+            raise RuntimeError(
+                f"No {plan.protocol} {plan.action} instructions available; "
+                "refusing to send a swap-only rebalance"
+            )
+        payer = Pubkey.from_string(plan.wallet)
+        lookup_tables, _ = await asyncio.gather(
+            self._lookup_table_accounts(table_addresses),
+            self.fees.sample(_writable_accounts([*swap_ixs, *extra_ixs], payer)),
+        )
+        fee_levels = self.fees.candidates()
+        candidates = [
+            self._build(payer, [*swap_ixs, *extra_ixs], lookup_tables, blockhash, fee)
+            for fee in fee_levels
+        ]
+        built = time.perf_counter()
+
+        simulations = await asyncio.gather(*(self._simulate(tx) for tx in candidates))
+        simulated = time.perf_counter()
+
+        report = [
+            {
+                "priority_fee_micro_lamports": fee,
+                "ok": sim.get("err") is None,
+                "units_consumed": sim.get("unitsConsumed"),
+                "error": sim.get("err"),
+            }
+            for fee, sim in zip(fee_levels, simulations)
+        ]
+        passing = [i for i, entry in enumerate(report) if entry["ok"]]
+        result: dict[str, Any] = {
+            "execution": "live" if self.live else "dry_run",
+            "plan": {
+                "protocol": plan.protocol,
+                "action": plan.action,
+                "input_mint": plan.input_mint,
+                "output_mint": plan.output_mint,
+                "amount": plan.amount,
+                "swap_mode": plan.swap_mode,
+                "urgent": plan.urgent,
+            },
+            # False: only the swap was simulated, not the protective transaction.
+            "protective_leg": bool(extra_ixs),
+            "candidates": report,
+            "selected_priority_fee": None,
+            "signature": None,
+        }
+
+        sent_at = None
+        if passing:
+            chosen = passing[-1] if plan.urgent else passing[0]
+            result["selected_priority_fee"] = fee_levels[chosen]
+            if self.live:
+                sent = await rpc_call(
+                    self.rpc_url,
+                    "sendTransaction",
+                    [
+                        base64.b64encode(bytes(candidates[chosen])).decode(),
+                        # Already simulated above; preflight would repeat it.
+                        {"encoding": "base64", "skipPreflight": True},
+                    ],
+                    client=self.client,
+                )
+                sent_at = time.perf_counter()
+                if "error" in sent:
+                    result["error"] = sent["error"]
+                else:
+                    result["signature"] = sent["result"]
+        else:
+            result["error"] = "No fee candidate simulated successfully"
+
+        timings = {
+            "pre_pipeline": _ms(started - triggered_at),
+            "build": _ms(built - started),
+            "simulate": _ms(simulated - built),
+        }
+        if sent_at is not None:
+            timings["send"] = _ms(sent_at - simulated)
+            timings["trigger_to_send"] = _ms(sent_at - triggered_at)
+        else:
+            # Dry run or nothing to send: no send latency to report.
+            timings["trigger_to_decision"] = _ms(simulated - triggered_at)
+        result["timings_ms"] = timings
+        return result
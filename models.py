@@ -30,12 +30,18 @@ class RiskLevel(str, Enum):
 class Position:
     protocol: str
     wallet: str
-    health_factor: float
+    health_factor: float | None  # None: unpriced (no oracle prices for the protocol)
     collateral_usd: float
     debt_usd: float
-    risk_level: RiskLevel
+    risk_level: RiskLevel | None  # None when unpriced
     tokens_collateral: list[str]
     tokens_debt: list[str]
+    demo: bool = False  # placeholder data shown when the RPC fetch failed
+    account: str | None = None  # on-chain obligation / margin account address
+
+    @property
+    def priced(self) -> bool:
+        return self.health_factor is not None
 
     def to_dict(self) -> dict[str, Any]:
         return {
@@ -44,7 +50,9 @@ class Position:
             "health_factor": self.health_factor,
             "collateral_usd": self.collateral_usd,
             "debt_usd": self.debt_usd,
-            "risk_level": self.risk_level.value,
+            "risk_level": self.risk_level.value if self.risk_level else None,
             "tokens_collateral": self.tokens_collateral,
             "tokens_debt": self.tokens_debt,
+            "demo": self.demo,
+            "account": self.account,
         }
@@ -9,59 +9,15 @@ DeveloperWeek 2026 Hackathon — Kilo "For Devs, By Devs" Challenge
 
 import json
 import os
-from dataclasses import dataclass
-from enum import Enum
+import time
 from typing import Any
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
 
-# ---------------------------------------------------------------------------
-# Domain types
-# ---------------------------------------------------------------------------
-
-class RiskLevel(str, Enum):
-    HEALTHY = "healthy"
-    WARNING = "warning"
-    CRITICAL = "critical"
-    EMERGENCY = "emergency"
-
-    @classmethod
-    def from_health_factor(cls, hf: float) -> "RiskLevel":
-        if hf >= 1.5:
-            return cls.HEALTHY
-        elif hf >= 1.2:
-            return cls.WARNING
-        elif hf >= 1.05:
-            return cls.CRITICAL
-        else:
-            return cls.EMERGENCY
-
-
-@dataclass
-class Position:
-    protocol: str
-    wallet: str
-    health_factor: float
-    collateral_usd: float
-    debt_usd: float
-    risk_level: RiskLevel
-    tokens_collateral: list[str]
-    tokens_debt: list[str]
-
-    def to_dict(self) -> dict[str, Any]:
-        return {
-            "protocol": self.protocol,
-            "wallet": self.wallet,
-            "health_factor": self.health_factor,
-            "collateral_usd": self.collateral_usd,
-            "debt_usd": self.debt_usd,
-            "risk_level": self.risk_level.value,
-            "tokens_collateral": self.tokens_collateral,
-            "tokens_debt": self.tokens_debt,
-        }
-
+from executor import RebalancePipeline, RebalancePlan, load_signer, plan_rebalance
+from models import Position
 
 # ---------------------------------------------------------------------------
 # Protocol adapters (simplified for hackathon demo)
@@ -78,6 +34,15 @@ class ProtocolAdapter:
         """Fetch lending positions for a wallet. Override in subclasses."""
         raise NotImplementedError
 
+    async def rebalance_instructions(self, plan: "RebalancePlan") -> list[Any]:
+        """Protocol repay/deposit instructions to bundle with the Jupiter swap.
+
+        Defaults to none: dry runs then simulate the swap alone and live mode
+        refuses to send, since a swap without this leg would not protect the
+        position. Only Solend ``repay_debt`` is implemented so far.
+        """
+        return []
+
 
 class KaminoAdapter(ProtocolAdapter):
     def __init__(self, rpc_url: str):
@@ -107,6 +72,14 @@ class SolendAdapter(ProtocolAdapter):
         from solana_client import fetch_solend_positions
         return await fetch_solend_positions(self.rpc_url, wallet)
 
+    async def rebalance_instructions(self, plan: "RebalancePlan") -> list[Any]:
+        if plan.action != "repay_debt" or plan.account is None:
+            return []
+        from solana_client import solend_repay_instructions
+        return await solend_repay_instructions(
+            self.rpc_url, plan.account, plan.wallet, plan.output_mint, plan.amount
+        )
+
 
 # ---------------------------------------------------------------------------
 # AI risk analyzer
@@ -118,13 +91,21 @@ async def analyze_risk(position: Position) -> dict[str, Any]:
 
     client = anthropic.AsyncAnthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
 
+    if position.priced:
+        health_factor = position.health_factor
+        collateral = f"${position.collateral_usd:,.2f}"
+        debt = f"${position.debt_usd:,.2f}"
+        risk_level = position.risk_level.value
+    else:
+        health_factor = collateral = debt = risk_level = "unknown (no oracle prices)"
+
     prompt = f"""Analyze this DeFi lending position for liquidation risk:
 
 Protocol: {position.protocol}
-Health Factor: {position.health_factor}
-Collateral: ${position.collateral_usd:,.2f} ({', '.join(position.tokens_collateral)})
-Debt: ${position.debt_usd:,.2f} ({', '.join(position.tokens_debt)})
-Risk Level: {position.risk_level.value}
+Health Factor: {health_factor}
+Collateral: {collateral} ({', '.join(position.tokens_collateral)})
+Debt: {debt} ({', '.join(position.tokens_debt)})
+Risk Level: {risk_level}
 
 Provide:
 1. Risk assessment (1-10 scale)
@@ -176,13 +157,18 @@ async def simulate_jupiter_swap(
 app = Server("solshield")
 
 PROTOCOLS: list[ProtocolAdapter] = []
+PIPELINE: RebalancePipeline | None = None
 
 
-def _init_protocols() -> list[ProtocolAdapter]:
-    rpc_url = os.environ.get(
+def _rpc_url() -> str:
+    return os.environ.get(
         "SOLANA_RPC_URL",
         f"https://mainnet.helius-rpc.com/?api-key={os.environ.get('HELIUS_API_KEY', '')}",
     )
+
+
+def _init_protocols() -> list[ProtocolAdapter]:
+    rpc_url = _rpc_url()
     return [
         KaminoAdapter(rpc_url),
         MarginFiAdapter(rpc_url),
@@ -190,6 +176,18 @@ def _init_protocols() -> list[ProtocolAdapter]:
     ]
 
 
+async def _get_pipeline() -> RebalancePipeline:
+    global PIPELINE
+    if PIPELINE is None:
+        PIPELINE = RebalancePipeline(
+            _rpc_url(),
+            signer=load_signer(),
+            live=os.environ.get("LIVE_MODE", "false").lower() == "true",
+        )
+        await PIPELINE.start()
+    return PIPELINE
+
+
 @app.list_tools()
 async def list_tools() -> list[Tool]:
     return [
@@ -387,6 +385,7 @@ async def call_tool(name: str, arguments: dict[str, Any]) -> list[TextContent]:
         return [TextContent(type="text", text=json.dumps(result, indent=2))]
 
     elif name == "execute_rebalance":
+        triggered_at = time.perf_counter()
         if not arguments.get("confirm"):
             return [
                 TextContent(
@@ -394,10 +393,28 @@ async def call_tool(name: str, arguments: dict[str, Any]) -> list[TextContent]:
                     text="❌ Execution requires confirm=true. Simulate first.",
                 )
             ]
-        result = {
-            "execution": "dry_run",
-            "message": "Rebalance would execute via Jupiter. Set LIVE_MODE=true for real transactions.",
-        }
+        wallet = arguments["wallet"]
+        protocol = arguments["protocol"]
+        adapter = next(
+            (a for a in PROTOCOLS if a.protocol_name.lower() == protocol), None
+        )
+        if not adapter:
+            return [TextContent(type="text", text=f"Unknown protocol: {protocol}")]
+        positions = await adapter.get_positions(wallet)
+        if not positions:
+            return [TextContent(type="text", text="No positions found")]
+        try:
+            plan = plan_rebalance(
+                positions[0], arguments["action"], arguments["amount_usd"]
+            )
+            pipeline = await _get_pipeline()
+            result = await pipeline.execute(
+                plan,
+                protocol_instructions=adapter.rebalance_instructions(plan),
+                triggered_at=triggered_at,
+            )
+        except Exception as e:
+            return [TextContent(type="text", text=f"❌ Rebalance failed: {e}")]
         return [TextContent(type="text", text=json.dumps(result, indent=2))]
 
     elif name == "set_alert_threshold":
@@ -4,24 +4,59 @@ In production, these query actual on-chain accounts via Solana RPC.
 For the hackathon demo, includes both real RPC calls and fallback demo data.
 """
 
+import asyncio
+import base64
+import sys
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, fields
 from typing import Any
 
 import httpx
+from solders.instruction import AccountMeta, Instruction
+from solders.pubkey import Pubkey
+from solders.token.associated import get_associated_token_address
 
 from models import Position, RiskLevel
 
+try:
+    import zstandard
+except ImportError:  # optional — without it accounts are fetched as plain base64
+    zstandard = None
+
 
 # ---------------------------------------------------------------------------
 # Solana RPC helpers
 # ---------------------------------------------------------------------------
 
-async def rpc_call(rpc_url: str, method: str, params: list[Any]) -> dict:
-    """Make a Solana JSON-RPC call."""
+# Mints for the tokens SolShield reports and rebalances between.
+TOKEN_MINTS = {
+    "SOL": "So11111111111111111111111111111111111111112",
+    "USDC": "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v",
+    "USDT": "Es9vMFrzaCERmJfrF4H2FYD4KCoNkY11McCe8BenwNYB",
+    "mSOL": "mSoLzYCxHdYgdzU16g5QSh3i5K3z3KZK7ytfqcJm7So",
+    "JitoSOL": "J1toso1uCk3RLmjorhTtrVwY9HJ7X8V9yYac6Y7kGCPn",
+}
+
+TOKEN_PROGRAM = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+
+
+async def rpc_call(
+    rpc_url: str,
+    method: str,
+    params: list[Any],
+    client: httpx.AsyncClient | None = None,
+) -> dict:
+    """Make a Solana JSON-RPC call.
+
+    Pass a long-lived ``client`` on latency-sensitive paths to reuse its
+    connection instead of opening a new one per call.
+    """
+    payload = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
+    if client is not None:
+        resp = await client.post(rpc_url, json=payload)
+        return resp.json()
     async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(
-            rpc_url,
-            json={"jsonrpc": "2.0", "id": 1, "method": method, "params": params},
-        )
+        resp = await client.post(rpc_url, json=payload)
         return resp.json()
 
 
@@ -32,13 +67,327 @@ async def get_token_accounts(rpc_url: str, wallet: str) -> list[dict]:
         "getTokenAccountsByOwner",
         [
             wallet,
-            {"programId": "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"},
+            {"programId": TOKEN_PROGRAM},
             {"encoding": "jsonParsed"},
         ],
     )
     return result.get("result", {}).get("value", [])
 
 
+# ---------------------------------------------------------------------------
+# Sliced account fetches
+# ---------------------------------------------------------------------------
+
+# RPC endpoints that rejected base64+zstd; they get plain base64 from then on.
+_ZSTD_UNSUPPORTED: set[str] = set()
+
+_MINT_SYMBOLS = {mint: symbol for symbol, mint in TOKEN_MINTS.items()}
+
+# Caps the reported health factor of debt-free positions (keeps output valid JSON).
+HEALTH_FACTOR_CAP = 100.0
+
+
+@dataclass
+class AccountLayout:
+    """Byte ranges a protocol decoder reads from a fixed-size account.
+
+    ``sections`` maps a name to ``(offset, length)`` within the full account.
+    RPC nodes accept a single ``dataSlice`` per request, so fetches ask for
+    the smallest span covering the requested sections.
+    """
+
+    size: int
+    sections: dict[str, tuple[int, int]]
+
+    def data_slice(self, sections: list[str] | None = None) -> dict[str, int]:
+        spans = [self.sections[name] for name in (sections or self.sections)]
+        start = min(offset for offset, _ in spans)
+        end = max(offset + length for offset, length in spans)
+        return {"offset": start, "length": end - start}
+
+
+@dataclass
+class AccountView:
+    """Raw bytes of a (possibly sliced) account, addressed by full-account offsets."""
+
+    pubkey: str
+    data: bytes
+    base_offset: int = 0
+
+    def read(self, offset: int, length: int) -> bytes:
+        start = offset - self.base_offset
+        if start < 0 or start + length > len(self.data):
+            raise ValueError(
+                f"{self.pubkey}: bytes {offset}..{offset + length} not in fetched slice"
+            )
+        return self.data[start : start + length]
+
+    def uint(self, offset: int, length: int) -> int:
+        return int.from_bytes(self.read(offset, length), "little")
+
+    def u8(self, offset: int) -> int:
+        return self.uint(offset, 1)
+
+    def u128(self, offset: int) -> int:
+        return self.uint(offset, 16)
+
+    def i128(self, offset: int) -> int:
+        return int.from_bytes(self.read(offset, 16), "little", signed=True)
+
+    def pubkey_at(self, offset: int) -> str | None:
+        """Base58 pubkey at ``offset``, or None for an all-zero (unused) slot."""
+        raw = self.read(offset, 32)
+        if not any(raw):
+            return None
+        return str(Pubkey.from_bytes(raw))
+
+
+def _decode_account_data(data: list[str]) -> bytes:
+    """Decode an RPC ``[payload, encoding]`` pair into raw bytes."""
+    payload, encoding = data
+    raw = base64.b64decode(payload)
+    if encoding == "base64+zstd":
+        if zstandard is None:
+            raise RuntimeError("base64+zstd response but zstandard is not installed")
+        # Solana's zstd frames omit the content size, so stream-decompress.
+        return zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+    return raw
+
+
+def _rejects_encoding(error: dict[str, Any]) -> bool:
+    """True for the invalid-params error an endpoint gives for an unknown encoding."""
+    return error.get("code") == -32602 or "encoding" in str(error.get("message", ""))
+
+
+async def _sliced_rpc_call(
+    rpc_url: str, method: str, target: Any, config: dict[str, Any]
+) -> dict:
+    """Call ``method`` preferring base64+zstd, falling back to plain base64.
+
+    zstd is disabled for the endpoint only when it rejects the encoding and
+    the plain base64 retry then succeeds; a -32602 caused by anything else in
+    the request fails both attempts and is raised without recording anything,
+    as is any other RPC error (rate limits, node trouble).
+    """
+    use_zstd = zstandard is not None and rpc_url not in _ZSTD_UNSUPPORTED
+    config = {"encoding": "base64+zstd" if use_zstd else "base64", **config}
+    result = await rpc_call(rpc_url, method, [target, config])
+    if use_zstd and "error" in result and _rejects_encoding(result["error"]):
+        config = {**config, "encoding": "base64"}
+        result = await rpc_call(rpc_url, method, [target, config])
+        if "error" not in result:
+            _ZSTD_UNSUPPORTED.add(rpc_url)
+    if "error" in result:
+        raise RuntimeError(f"{method}: {result['error']}")
+    return result
+
+
+def _account_view(
+    pubkey: str, data: list[str], layout: AccountLayout, data_slice: dict[str, int]
+) -> AccountView:
+    raw = _decode_account_data(data)
+    # Endpoints that ignore dataSlice return the whole account.
+    base_offset = 0 if len(raw) == layout.size else data_slice["offset"]
+    return AccountView(pubkey, raw, base_offset)
+
+
+def _with_context(body: dict[str, Any]) -> tuple[list, int | None]:
+    """Split a ``{"context": ..., "value": ...}`` result into value and slot."""
+    return body.get("value", []), body.get("context", {}).get("slot") or None
+
+
+async def get_slot(rpc_url: str) -> int | None:
+    """Current slot, or None if the endpoint cannot say."""
+    try:
+        result = await rpc_call(rpc_url, "getSlot", [])
+    except Exception:
+        return None
+    return result.get("result") or None
+
+
+async def get_program_accounts_sliced(
+    rpc_url: str,
+    program_id: str,
+    layout: AccountLayout,
+    filters: list[dict],
+    sections: list[str] | None = None,
+) -> tuple[int | None, list[AccountView]]:
+    """Fetch program accounts, transferring only the bytes ``sections`` need.
+
+    Requests ``base64+zstd`` when zstandard is installed and the endpoint has
+    not rejected it before; if the endpoint rejects the encoding the call is
+    retried once as plain ``base64``, and the endpoint is remembered if that
+    succeeds. Endpoints that ignore ``dataSlice`` and return whole accounts
+    are handled transparently.
+
+    Returns the context slot (None if the endpoint gave none) alongside
+    the accounts.
+    """
+    data_slice = layout.data_slice(sections)
+    result = await _sliced_rpc_call(
+        rpc_url,
+        "getProgramAccounts",
+        program_id,
+        {
+            "dataSlice": data_slice,
+            "filters": [{"dataSize": layout.size}, *filters],
+            "withContext": True,
+        },
+    )
+    body = result.get("result") or []
+    # Endpoints that ignore withContext return the bare account list.
+    accounts, slot = (body, None) if isinstance(body, list) else _with_context(body)
+    views = [
+        _account_view(account["pubkey"], account["account"]["data"], layout, data_slice)
+        for account in accounts or []
+    ]
+    return slot, views
+
+
+async def get_multiple_accounts_sliced(
+    rpc_url: str,
+    addresses: list[str],
+    layout: AccountLayout,
+    sections: list[str] | None = None,
+) -> tuple[int | None, list[AccountView | None]]:
+    """Sliced ``getMultipleAccounts``; missing accounts come back as None."""
+    data_slice = layout.data_slice(sections)
+    result = await _sliced_rpc_call(
+        rpc_url, "getMultipleAccounts", addresses, {"dataSlice": data_slice}
+    )
+    accounts, slot = _with_context(result["result"])
+    views = [
+        _account_view(address, account["data"], layout, data_slice)
+        if account is not None
+        else None
+        for address, account in zip(addresses, accounts)
+    ]
+    return slot, views
+
+
+def _health_factor(liquidation_value: float, debt_value: float) -> float:
+    if debt_value <= 0:
+        return HEALTH_FACTOR_CAP
+    return round(min(liquidation_value / debt_value, HEALTH_FACTOR_CAP), 4)
+
+
+def _token_symbol(mint: str) -> str:
+    return _MINT_SYMBOLS.get(mint, mint)
+
+
+# ---------------------------------------------------------------------------
+# Reserve registry
+# ---------------------------------------------------------------------------
+
+# Reserve parameters are re-read after ~1 hour of slots; they rarely change.
+RESERVE_REFRESH_SLOTS = 9_000
+# getMultipleAccounts accepts at most 100 addresses per request.
+_MULTIPLE_ACCOUNTS_LIMIT = 100
+
+
+@dataclass(slots=True)
+class ReserveInfo:
+    """Per-reserve (MarginFi: per-bank) parameters used to value obligations.
+
+    ``liquidation_threshold`` is a plain fraction (MarginFi: the maintenance
+    asset weight). ``cumulative_borrow_rate`` is Kamino/Solend only and the
+    share values MarginFi only; all are normalised to 1.0-based floats.
+    """
+
+    address: str
+    mint: str
+    liquidation_threshold: float
+    cumulative_borrow_rate: float = 1.0
+    asset_share_value: float = 1.0
+    liability_share_value: float = 1.0
+    slot: int = 0
+
+
+class ReserveRegistry:
+    """Slot-aware cache of one protocol's reserve accounts.
+
+    Each reserve is held as a single ReserveInfo instance that is updated in
+    place on refresh, so every obligation referencing it shares the object.
+    Missing or stale reserves are loaded in bulk, one batched request per
+    100 addresses.
+    """
+
+    def __init__(
+        self,
+        layout: AccountLayout,
+        decode: Callable[[AccountView], ReserveInfo],
+        refresh_slots: int = RESERVE_REFRESH_SLOTS,
+    ):
+        self.layout = layout
+        self.decode = decode
+        self.refresh_slots = refresh_slots
+        self._reserves: dict[str, ReserveInfo] = {}
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self, address: str, slot: int | None) -> bool:
+        reserve = self._reserves.get(address)
+        if reserve is None or not slot or not reserve.slot:
+            return False
+        return slot - reserve.slot <= self.refresh_slots
+
+    async def get_many(
+        self, rpc_url: str, addresses: Iterable[str], slot: int | None
+    ) -> dict[str, ReserveInfo]:
+        """Return reserves for ``addresses``, loading any missing or stale as of ``slot``.
+
+        A missing ``slot`` (endpoint returned no context) is looked up with
+        ``getSlot``; if that fails too, every reserve is treated as stale.
+        """
+        wanted = list(dict.fromkeys(addresses))
+        if not wanted:
+            return {}
+        if not slot:
+            slot = await get_slot(rpc_url)
+        async with self._lock:
+            stale = [a for a in wanted if not self._is_fresh(a, slot)]
+            if stale:
+                await self._load(rpc_url, stale)
+        return {a: self._reserves[a] for a in wanted if a in self._reserves}
+
+    async def _load(self, rpc_url: str, addresses: list[str]) -> None:
+        batches = await asyncio.gather(
+            *(
+                get_multiple_accounts_sliced(
+                    rpc_url, addresses[i : i + _MULTIPLE_ACCOUNTS_LIMIT], self.layout
+                )
+                for i in range(0, len(addresses), _MULTIPLE_ACCOUNTS_LIMIT)
+            )
+        )
+        for slot, views in batches:
+            for view in views:
+                if view is None:
+                    continue
+                fresh = self.decode(view)
+                fresh.slot = slot or 0
+                existing = self._reserves.get(view.pubkey)
+                if existing is None:
+                    self._reserves[sys.intern(view.pubkey)] = fresh
+                else:
+                    for field in fields(ReserveInfo):
+                        setattr(existing, field.name, getattr(fresh, field.name))
+
+
+def _entry_reserve(
+    view: AccountView, offset: int, reserves: dict[str, ReserveInfo]
+) -> ReserveInfo | None:
+    """Reserve (or bank) keyed at ``offset``; None for an unused slot.
+
+    Raises if the reserve did not load, so a position is never valued from
+    a subset of its entries.
+    """
+    key = view.pubkey_at(offset)
+    if key is None:
+        return None
+    if key not in reserves:
+        raise ValueError(f"{view.pubkey}: reserve {key} could not be loaded")
+    return reserves[key]
+
+
 # ---------------------------------------------------------------------------
 # Kamino Finance
 # ---------------------------------------------------------------------------
@@ -47,54 +396,144 @@ async def get_token_accounts(rpc_url: str, wallet: str) -> list[dict]:
 KAMINO_LENDING_PROGRAM = "KLend2g3cP87ber41GjNkqnm3RMLvTmRBUiHpMhCA4X"
 
 
+# Kamino scaled fractions are fixed-point with 60 fractional bits.
+_KAMINO_SF_ONE = 1 << 60
+
+# Offsets follow klend's `Obligation` (programs/klend/src/state/obligation.rs),
+# including the 8-byte Anchor discriminator: tag @8, last_update @16,
+# lending_market @32, owner @64, deposits @96, deposited_value_sf @1192,
+# borrows @1208.
+KAMINO_OBLIGATION_OWNER_OFFSET = 64
+# ObligationCollateral: deposit_reserve, deposited_amount u64 @32,
+# market_value_sf u128 @40, then elevation-group amount and padding.
+_KAMINO_DEPOSIT_LEN = 136
+# ObligationLiquidity: borrow_reserve, cumulative_borrow_rate_bsf
+# (BigFractionBytes, 48 bytes) @32, padding u64, borrowed_amount_sf @88,
+# market_value_sf @104, then adjusted values and padding.
+_KAMINO_BORROW_LEN = 200
+
+KAMINO_OBLIGATION_LAYOUT = AccountLayout(
+    size=3344,
+    sections={
+        "deposits": (96, 8 * _KAMINO_DEPOSIT_LEN),
+        "borrows": (1208, 5 * _KAMINO_BORROW_LEN),
+    },
+)
+
+# Offsets follow klend's `Reserve` (programs/klend/src/state/reserve.rs):
+# ReserveLiquidity @128 (mint_pubkey @128, cumulative_borrow_rate_bsf @296),
+# ReserveConfig @4856 (liquidation_threshold_pct @4873).
+KAMINO_RESERVE_LAYOUT = AccountLayout(
+    size=8624,
+    sections={
+        # mint_pubkey .. cumulative_borrow_rate_bsf.value ([u64; 4])
+        "liquidity": (128, 200),
+        "config": (4873, 1),
+    },
+)
+
+
+def _kamino_big_fraction(view: AccountView, offset: int) -> float:
+    """BigFractionBytes: a [u64; 4] little-endian value (60 fractional bits) + padding."""
+    return view.uint(offset, 32) / _KAMINO_SF_ONE
+
+
+def decode_kamino_reserve(view: AccountView) -> ReserveInfo:
+    return ReserveInfo(
+        address=view.pubkey,
+        mint=sys.intern(view.pubkey_at(128) or ""),
+        liquidation_threshold=view.u8(4873) / 100,
+        cumulative_borrow_rate=_kamino_big_fraction(view, 296),
+    )
+
+
+KAMINO_RESERVES = ReserveRegistry(KAMINO_RESERVE_LAYOUT, decode_kamino_reserve)
+
+
+def kamino_obligation_reserves(view: AccountView) -> list[str]:
+    """Reserve addresses referenced by a Kamino obligation's deposits and borrows."""
+    deposits, _ = KAMINO_OBLIGATION_LAYOUT.sections["deposits"]
+    borrows, _ = KAMINO_OBLIGATION_LAYOUT.sections["borrows"]
+    keys = [view.pubkey_at(deposits + i * _KAMINO_DEPOSIT_LEN) for i in range(8)]
+    keys += [view.pubkey_at(borrows + i * _KAMINO_BORROW_LEN) for i in range(5)]
+    return [key for key in keys if key]
+
+
+def decode_kamino_obligation(
+    view: AccountView, wallet: str, reserves: dict[str, ReserveInfo]
+) -> Position:
+    """Build a Position from a Kamino obligation's deposits and borrows.
+
+    Deposits are weighted by their reserve's liquidation threshold; borrows
+    are accrued from the obligation's rate snapshot to the reserve's current
+    cumulative borrow rate.
+    """
+    deposits, _ = KAMINO_OBLIGATION_LAYOUT.sections["deposits"]
+    borrows, _ = KAMINO_OBLIGATION_LAYOUT.sections["borrows"]
+    collateral_usd = unhealthy_usd = debt_usd = 0.0
+    tokens_collateral, tokens_debt = [], []
+
+    for i in range(8):
+        offset = deposits + i * _KAMINO_DEPOSIT_LEN
+        reserve = _entry_reserve(view, offset, reserves)
+        if reserve is None:
+            continue
+        value = view.u128(offset + 40) / _KAMINO_SF_ONE
+        collateral_usd += value
+        unhealthy_usd += value * reserve.liquidation_threshold
+        tokens_collateral.append(_token_symbol(reserve.mint))
+
+    for i in range(5):
+        offset = borrows + i * _KAMINO_BORROW_LEN
+        reserve = _entry_reserve(view, offset, reserves)
+        if reserve is None:
+            continue
+        snapshot_rate = _kamino_big_fraction(view, offset + 32)
+        value = view.u128(offset + 104) / _KAMINO_SF_ONE  # market_value_sf
+        if snapshot_rate:
+            value *= reserve.cumulative_borrow_rate / snapshot_rate
+        debt_usd += value
+        tokens_debt.append(_token_symbol(reserve.mint))
+
+    health_factor = _health_factor(unhealthy_usd, debt_usd)
+    return Position(
+        protocol="Kamino",
+        wallet=wallet,
+        health_factor=health_factor,
+        collateral_usd=round(collateral_usd, 2),
+        debt_usd=round(debt_usd, 2),
+        risk_level=RiskLevel.from_health_factor(health_factor),
+        tokens_collateral=tokens_collateral,
+        tokens_debt=tokens_debt,
+        account=view.pubkey,
+    )
+
+
 async def fetch_kamino_positions(rpc_url: str, wallet: str) -> list[Position]:
     """Fetch Kamino lending positions for a wallet.
 
-    Queries the Kamino Lending program for obligation accounts owned by the wallet.
+    Queries the Kamino Lending program for obligation accounts owned by the
+    wallet, fetching only the sections the decoder reads. Referenced reserves
+    come from KAMINO_RESERVES, so a warm cache adds no further RPCs.
     """
     try:
-        result = await rpc_call(
+        slot, accounts = await get_program_accounts_sliced(
             rpc_url,
-            "getProgramAccounts",
-            [
-                KAMINO_LENDING_PROGRAM,
-                {
-                    "encoding": "base64",
-                    "filters": [
-                        {"dataSize": 1300},  # Obligation account size
-                        {
-                            "memcmp": {
-                                "offset": 32,  # Owner field offset
-                                "bytes": wallet,
-                            }
-                        },
-                    ],
-                },
+            KAMINO_LENDING_PROGRAM,
+            KAMINO_OBLIGATION_LAYOUT,
+            filters=[
+                {"memcmp": {"offset": KAMINO_OBLIGATION_OWNER_OFFSET, "bytes": wallet}}
             ],
+            sections=["deposits", "borrows"],
         )
-
-        accounts = result.get("result", [])
-        if not accounts:
-            return []
-
-        # Parse obligation accounts to extract health factor
-        positions = []
-        for _account in accounts:
-            # In production: deserialize the obligation account data
-            # using Kamino's IDL to get exact collateral/debt values
-            positions.append(
-                Position(
-                    protocol="Kamino",
-                    wallet=wallet,
-                    health_factor=0.0,  # Parsed from account data
-                    collateral_usd=0.0,
-                    debt_usd=0.0,
-                    risk_level=RiskLevel.HEALTHY,
-                    tokens_collateral=[],
-                    tokens_debt=[],
-                )
-            )
-        return positions
+        reserves = await KAMINO_RESERVES.get_many(
+            rpc_url,
+            (key for account in accounts for key in kamino_obligation_reserves(account)),
+            slot,
+        )
+        return [
+            decode_kamino_obligation(account, wallet, reserves) for account in accounts
+        ]
 
     except Exception:
         # Fallback to demo data for hackathon presentation
@@ -113,6 +552,7 @@ def _demo_kamino_position(wallet: str) -> list[Position]:
             risk_level=RiskLevel.WARNING,
             tokens_collateral=["SOL", "mSOL"],
             tokens_debt=["USDC"],
+            demo=True,
         )
     ]
 
@@ -124,43 +564,111 @@ def _demo_kamino_position(wallet: str) -> list[Position]:
 MARGINFI_PROGRAM = "MFv2hWf31Z9kbCa1snEPYctwafyhdvnV7FZnsebVacA"
 
 
+# MarginFi amounts are I80F48 fixed-point (48 fractional bits).
+_I80F48_ONE = 1 << 48
+
+# Offsets follow marginfi-v2's `MarginfiAccount` (programs/marginfi/src/state/
+# marginfi_account.rs), including the Anchor discriminator: group @8,
+# authority @40, lending_account.balances @72, 2312 bytes in total.
+MARGINFI_ACCOUNT_AUTHORITY_OFFSET = 40
+
+MARGINFI_ACCOUNT_LAYOUT = AccountLayout(
+    size=2312,
+    sections={
+        # 16 x (active u8, bank, pad, asset_shares i80f48, liability_shares i80f48, ...)
+        "balances": (72, 16 * 104),
+    },
+)
+
+# Offsets follow marginfi-v2's `Bank`: mint @8, asset_share_value @80,
+# liability_share_value @96, BankConfig @296 (asset_weight_maint @312).
+MARGINFI_BANK_LAYOUT = AccountLayout(
+    size=1864,
+    sections={
+        "shares": (8, 104),
+        "config": (312, 16),
+    },
+)
+
+
+def decode_marginfi_bank(view: AccountView) -> ReserveInfo:
+    return ReserveInfo(
+        address=view.pubkey,
+        mint=sys.intern(view.pubkey_at(8) or ""),
+        liquidation_threshold=view.i128(312) / _I80F48_ONE,
+        asset_share_value=view.i128(80) / _I80F48_ONE,
+        liability_share_value=view.i128(96) / _I80F48_ONE,
+    )
+
+
+MARGINFI_BANKS = ReserveRegistry(MARGINFI_BANK_LAYOUT, decode_marginfi_bank)
+
+
+def _marginfi_active_balances(view: AccountView) -> list[int]:
+    """Offsets of the active balance slots in a MarginFi account."""
+    balances, _ = MARGINFI_ACCOUNT_LAYOUT.sections["balances"]
+    offsets = (balances + i * 104 for i in range(16))
+    return [offset for offset in offsets if view.u8(offset)]
+
+
+def marginfi_account_banks(view: AccountView) -> list[str]:
+    """Bank addresses referenced by a MarginFi account's active balances."""
+    keys = [view.pubkey_at(offset + 1) for offset in _marginfi_active_balances(view)]
+    return [key for key in keys if key]
+
+
+def decode_marginfi_account(
+    view: AccountView, wallet: str, banks: dict[str, ReserveInfo]
+) -> Position:
+    """Build a Position from a MarginFi account.
+
+    Shares are converted to token amounts with the bank's share values and
+    sub-unit dust is ignored, so each side lists the tokens actually held.
+    MarginFi banks hold no price, so until an oracle is wired in the
+    position is unpriced: no health factor or risk level, and zero USD values.
+    """
+    tokens_collateral, tokens_debt = [], []
+    for offset in _marginfi_active_balances(view):
+        bank = _entry_reserve(view, offset + 1, banks)
+        if bank is None:
+            continue
+        assets = view.i128(offset + 40) / _I80F48_ONE * bank.asset_share_value
+        liabilities = view.i128(offset + 56) / _I80F48_ONE * bank.liability_share_value
+        if assets >= 1:
+            tokens_collateral.append(_token_symbol(bank.mint))
+        if liabilities >= 1:
+            tokens_debt.append(_token_symbol(bank.mint))
+
+    return Position(
+        protocol="MarginFi",
+        wallet=wallet,
+        health_factor=None,
+        collateral_usd=0.0,
+        debt_usd=0.0,
+        risk_level=None,
+        tokens_collateral=tokens_collateral,
+        tokens_debt=tokens_debt,
+        account=view.pubkey,
+    )
+
+
 async def fetch_marginfi_positions(rpc_url: str, wallet: str) -> list[Position]:
     """Fetch MarginFi margin account positions."""
     try:
-        result = await rpc_call(
+        slot, accounts = await get_program_accounts_sliced(
             rpc_url,
-            "getProgramAccounts",
-            [
-                MARGINFI_PROGRAM,
-                {
-                    "encoding": "base64",
-                    "filters": [
-                        {"dataSize": 2656},  # MarginFi account size
-                        {"memcmp": {"offset": 8, "bytes": wallet}},
-                    ],
-                },
+            MARGINFI_PROGRAM,
+            MARGINFI_ACCOUNT_LAYOUT,
+            filters=[
+                {"memcmp": {"offset": MARGINFI_ACCOUNT_AUTHORITY_OFFSET, "bytes": wallet}}
             ],
         )
-
-        accounts = result.get("result", [])
-        if not accounts:
-            return []
-
-        positions = []
-        for _account in accounts:
-            positions.append(
-                Position(
-                    protocol="MarginFi",
-                    wallet=wallet,
-                    health_factor=0.0,
-                    collateral_usd=0.0,
-                    debt_usd=0.0,
-                    risk_level=RiskLevel.HEALTHY,
-                    tokens_collateral=[],
-                    tokens_debt=[],
-                )
-            )
-        return positions
+        banks = await MARGINFI_BANKS.get_many(
+            rpc_url,
+            (key for account in accounts for key in marginfi_account_banks(account)),
+            slot,
+        )
+        return [decode_marginfi_account(account, wallet, banks) for account in accounts]
 
     except Exception:
         return _demo_marginfi_position(wallet)
@@ -177,6 +685,7 @@ def _demo_marginfi_position(wallet: str) -> list[Position]:
             risk_level=RiskLevel.HEALTHY,
             tokens_collateral=["SOL", "JitoSOL"],
             tokens_debt=["USDC", "USDT"],
+            demo=True,
         )
     ]
 
@@ -188,48 +697,200 @@ def _demo_marginfi_position(wallet: str) -> list[Position]:
 SOLEND_PROGRAM = "So1endDq2YkqhipRh3WViPa8hFMqoontKXP7SsMy8us"
 
 
+# Solend Decimals are fixed-point with 18 decimal places (WAD).
+_SOLEND_WAD = 10**18
+
+SOLEND_OBLIGATION_LAYOUT = AccountLayout(
+    size=1300,
+    sections={
+        # deposits_len u8, borrows_len u8, then packed deposits followed by borrows
+        "reserves": (202, 2 + 1096),
+    },
+)
+
+SOLEND_RESERVE_LAYOUT = AccountLayout(
+    size=619,
+    sections={
+        # liquidity mint @42 .. cumulative_borrow_rate_wads @195
+        "liquidity": (42, 169),
+        # config.liquidation_threshold u8 (percent)
+        "config": (302, 1),
+        # lending_market @10 .. liquidity supply @75, pyth @107, switchboard @139
+        "accounts": (10, 161),
+    },
+)
+
+_SOLEND_DEPOSIT_LEN = 88  # reserve, deposited_amount u64, market_value, pad
+_SOLEND_BORROW_LEN = 112  # reserve, cumulative_rate_wads, amount_wads, market_value, pad
+
+
+def decode_solend_reserve(view: AccountView) -> ReserveInfo:
+    return ReserveInfo(
+        address=view.pubkey,
+        mint=sys.intern(view.pubkey_at(42) or ""),
+        liquidation_threshold=view.u8(302) / 100,
+        cumulative_borrow_rate=view.u128(195) / _SOLEND_WAD,
+    )
+
+
+SOLEND_RESERVES = ReserveRegistry(SOLEND_RESERVE_LAYOUT, decode_solend_reserve)
+
+
+def _solend_entries(view: AccountView) -> tuple[list[int], list[int]]:
+    """Offsets of the deposit and borrow entries packed after the lengths."""
+    offset, _ = SOLEND_OBLIGATION_LAYOUT.sections["reserves"]
+    deposits_len, borrows_len = view.u8(offset), view.u8(offset + 1)
+    deposits = [offset + 2 + i * _SOLEND_DEPOSIT_LEN for i in range(deposits_len)]
+    borrows_start = offset + 2 + deposits_len * _SOLEND_DEPOSIT_LEN
+    borrows = [borrows_start + i * _SOLEND_BORROW_LEN for i in range(borrows_len)]
+    return deposits, borrows
+
+
+def solend_obligation_reserves(view: AccountView) -> list[str]:
+    """Reserve addresses referenced by a Solend obligation."""
+    deposits, borrows = _solend_entries(view)
+    keys = [view.pubkey_at(offset) for offset in deposits + borrows]
+    return [key for key in keys if key]
+
+
+def decode_solend_obligation(
+    view: AccountView, wallet: str, reserves: dict[str, ReserveInfo]
+) -> Position:
+    """Build a Position from a Solend obligation's deposits and borrows.
+
+    Valued the same way as Kamino: liquidation-threshold-weighted deposits
+    over borrows accrued to the reserve's current cumulative borrow rate.
+    """
+    deposits, borrows = _solend_entries(view)
+    collateral_usd = unhealthy_usd = debt_usd = 0.0
+    tokens_collateral, tokens_debt = [], []
+
+    for offset in deposits:
+        reserve = _entry_reserve(view, offset, reserves)
+        if reserve is None:
+            continue
+        value = view.u128(offset + 40) / _SOLEND_WAD
+        collateral_usd += value
+        unhealthy_usd += value * reserve.liquidation_threshold
+        tokens_collateral.append(_token_symbol(reserve.mint))
+
+    for offset in borrows:
+        reserve = _entry_reserve(view, offset, reserves)
+        if reserve is None:
+            continue
+        snapshot_rate = view.u128(offset + 32) / _SOLEND_WAD
+        value = view.u128(offset + 64) / _SOLEND_WAD
+        if snapshot_rate:
+            value *= reserve.cumulative_borrow_rate / snapshot_rate
+        debt_usd += value
+        tokens_debt.append(_token_symbol(reserve.mint))
+
+    health_factor = _health_factor(unhealthy_usd, debt_usd)
+    return Position(
+        protocol="Solend",
+        wallet=wallet,
+        health_factor=health_factor,
+        collateral_usd=round(collateral_usd, 2),
+        debt_usd=round(debt_usd, 2),
+        risk_level=RiskLevel.from_health_factor(health_factor),
+        tokens_collateral=tokens_collateral,
+        tokens_debt=tokens_debt,
+        account=view.pubkey,
+    )
+
+
 async def fetch_solend_positions(rpc_url: str, wallet: str) -> list[Position]:
     """Fetch Solend obligation positions."""
     try:
-        result = await rpc_call(
+        slot, accounts = await get_program_accounts_sliced(
             rpc_url,
-            "getProgramAccounts",
-            [
-                SOLEND_PROGRAM,
-                {
-                    "encoding": "base64",
-                    "filters": [
-                        {"dataSize": 1300},
-                        {"memcmp": {"offset": 42, "bytes": wallet}},
-                    ],
-                },
-            ],
+            SOLEND_PROGRAM,
+            SOLEND_OBLIGATION_LAYOUT,
+            filters=[{"memcmp": {"offset": 42, "bytes": wallet}}],
+            sections=["reserves"],
         )
-
-        accounts = result.get("result", [])
-        if not accounts:
-            return []
-
-        positions = []
-        for _account in accounts:
-            positions.append(
-                Position(
-                    protocol="Solend",
-                    wallet=wallet,
-                    health_factor=0.0,
-                    collateral_usd=0.0,
-                    debt_usd=0.0,
-                    risk_level=RiskLevel.HEALTHY,
-                    tokens_collateral=[],
-                    tokens_debt=[],
-                )
-            )
-        return positions
+        reserves = await SOLEND_RESERVES.get_many(
+            rpc_url,
+            (key for account in accounts for key in solend_obligation_reserves(account)),
+            slot,
+        )
+        return [
+            decode_solend_obligation(account, wallet, reserves) for account in accounts
+        ]
 
     except Exception:
         return _demo_solend_position(wallet)
 
 
+# LendingInstruction tags in the token-lending program Solend forks.
+_SOLEND_REFRESH_RESERVE = 3
+_SOLEND_REPAY_OBLIGATION_LIQUIDITY = 11
+
+
+async def solend_repay_instructions(
+    rpc_url: str, obligation: str, wallet: str, mint: str, amount: int
+) -> list[Instruction]:
+    """RefreshReserve + RepayObligationLiquidity repaying ``amount`` of ``mint``.
+
+    Repays from the wallet's associated token account for ``mint``, which is
+    where a Jupiter swap delivers its output, so the pair can follow the swap
+    in one transaction. The reserve is refreshed first because repay rejects
+    a stale reserve.
+    """
+    slot, (view,) = await get_multiple_accounts_sliced(
+        rpc_url, [obligation], SOLEND_OBLIGATION_LAYOUT, ["reserves"]
+    )
+    if view is None:
+        raise ValueError(f"Solend obligation {obligation} not found")
+    _, borrows = _solend_entries(view)
+    keys = [key for key in (view.pubkey_at(offset) for offset in borrows) if key]
+    reserves = await SOLEND_RESERVES.get_many(rpc_url, keys, slot)
+    reserve = next(
+        (reserves[key] for key in keys if key in reserves and reserves[key].mint == mint),
+        None,
+    )
+    if reserve is None:
+        raise ValueError(f"Solend obligation {obligation} has no {mint} borrow")
+
+    _, (accounts,) = await get_multiple_accounts_sliced(
+        rpc_url, [reserve.address], SOLEND_RESERVE_LAYOUT, ["accounts"]
+    )
+    if accounts is None:
+        raise ValueError(f"Solend reserve {reserve.address} not found")
+
+    def key_at(offset: int) -> Pubkey:
+        return Pubkey.from_bytes(accounts.read(offset, 32))
+
+    program = Pubkey.from_string(SOLEND_PROGRAM)
+    owner = Pubkey.from_string(wallet)
+    reserve_key = Pubkey.from_string(reserve.address)
+    refresh = Instruction(
+        program,
+        bytes([_SOLEND_REFRESH_RESERVE]),
+        [
+            AccountMeta(reserve_key, False, True),
+            AccountMeta(key_at(107), False, False),  # pyth oracle
+            AccountMeta(key_at(139), False, False),  # switchboard oracle
+        ],
+    )
+    repay = Instruction(
+        program,
+        bytes([_SOLEND_REPAY_OBLIGATION_LIQUIDITY]) + amount.to_bytes(8, "little"),
+        [
+            AccountMeta(
+                get_associated_token_address(owner, Pubkey.from_string(mint)), False, True
+            ),
+            AccountMeta(key_at(75), False, True),  # reserve liquidity supply
+            AccountMeta(reserve_key, False, True),
+            AccountMeta(Pubkey.from_string(obligation), False, True),
+            AccountMeta(key_at(10), False, False),  # lending market
+            AccountMeta(owner, True, False),
+            AccountMeta(Pubkey.from_string(TOKEN_PROGRAM), False, False),
+        ],
+    )
+    return [refresh, repay]
+
+
 def _demo_solend_position(wallet: str) -> list[Position]:
     return [
         Position(
@@ -241,5 +902,6 @@ def _demo_solend_position(wallet: str) -> list[Position]:
             risk_level=RiskLevel.HEALTHY,
             tokens_collateral=["SOL"],
             tokens_debt=["USDC"],
+            demo=True,
         )
     ]
@@ -0,0 +1,362 @@
+"""Tests for the protective rebalance pipeline, against a stand-in RPC."""
+
+import base64
+import json
+
+import httpx
+import pytest
+from solders.hash import Hash
+from solders.instruction import AccountMeta, Instruction
+from solders.keypair import Keypair
+from solders.pubkey import Pubkey
+from solders.transaction import VersionedTransaction
+
+import executor
+from executor import (
+    MIN_PRIORITY_FEE,
+    BlockhashCache,
+    PriorityFeeEstimator,
+    RebalancePipeline,
+    plan_rebalance,
+)
+from models import Position, RiskLevel
+from solana_client import TOKEN_MINTS
+
+RPC_URL = "http://rpc.test"
+
+
+class StandInRpc:
+    """httpx.MockTransport handler serving Solana RPC and Jupiter endpoints."""
+
+    def __init__(self, fees=None, failing_fees=(), account_fees=None):
+        self.fees = fees or []
+        self.account_fees = account_fees  # served when the request names accounts
+        self.failing_fees = set(failing_fees)
+        self.methods: list[str] = []
+        self.params: list[list] = []
+        self.sent: list[bytes] = []
+        self.swap_program = Pubkey.new_unique()
+        self.swap_account = Pubkey.new_unique()
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/quote"):
+            return httpx.Response(200, json={"outAmount": "1"})
+        if request.url.path.endswith("/swap-instructions"):
+            wallet = json.loads(request.content)["userPublicKey"]
+            return httpx.Response(200, json=self._swap_instructions(wallet))
+
+        body = json.loads(request.content)
+        method, params = body["method"], body["params"]
+        self.methods.append(method)
+        self.params.append(params)
+        if method == "getLatestBlockhash":
+            result = {"value": {"blockhash": str(Hash.new_unique())}}
+        elif method == "getRecentPrioritizationFees":
+            result = self.account_fees if params and self.account_fees else self.fees
+        elif method == "simulateTransaction":
+            fee = self._compute_unit_price(params[0])
+            err = "InstructionError" if fee in self.failing_fees else None
+            result = {"value": {"err": err, "unitsConsumed": 1234}}
+        elif method == "sendTransaction":
+            self.sent.append(base64.b64decode(params[0]))
+            result = "5ig"
+        else:
+            return httpx.Response(200, json={"error": {"code": -32601}})
+        return httpx.Response(200, json={"jsonrpc": "2.0", "id": 1, "result": result})
+
+    def _swap_instructions(self, wallet: str) -> dict:
+        return {
+            "computeBudgetInstructions": [],
+            "setupInstructions": [],
+            "swapInstruction": {
+                "programId": str(self.swap_program),
+                "accounts": [
+                    {"pubkey": wallet, "isSigner": True, "isWritable": True},
+                    {"pubkey": str(self.swap_account), "isSigner": False, "isWritable": True},
+                ],
+                "data": base64.b64encode(b"swap").decode(),
+            },
+            "cleanupInstruction": None,
+            "addressLookupTableAddresses": [],
+        }
+
+    @staticmethod
+    def _compute_unit_price(tx_b64: str) -> int:
+        tx = VersionedTransaction.from_bytes(base64.b64decode(tx_b64))
+        price_ix = tx.message.instructions[1]  # after set_compute_unit_limit
+        return int.from_bytes(bytes(price_ix.data)[1:9], "little")
+
+
+def _position(wallet: str, risk_level=RiskLevel.WARNING, **overrides) -> Position:
+    fields = {
+        "protocol": "Kamino",
+        "wallet": wallet,
+        "health_factor": 1.3,
+        "collateral_usd": 1_000.0,
+        "debt_usd": 700.0,
+        "risk_level": risk_level,
+        "tokens_collateral": ["SOL"],
+        "tokens_debt": ["USDC"],
+    }
+    fields.update(overrides)
+    return Position(**fields)
+
+
+def _fee_samples(*fees: int, first_slot: int = 1) -> list[dict]:
+    return [
+        {"slot": first_slot + i, "prioritizationFee": fee} for i, fee in enumerate(fees)
+    ]
+
+
+# ---------------------------------------------------------------------------
+# PriorityFeeEstimator
+# ---------------------------------------------------------------------------
+
+async def test_fee_estimator_dedupes_slots_and_trims_window(monkeypatch):
+    monkeypatch.setattr(executor, "FEE_WINDOW_SLOTS", 3)
+    rpc = StandInRpc(fees=_fee_samples(10, 20, 30))
+    estimator = PriorityFeeEstimator(RPC_URL, rpc.client())
+
+    await estimator.refresh()
+    rpc.fees = _fee_samples(30, 40, first_slot=3)  # slot 3 overlaps
+    await estimator.refresh()
+
+    assert estimator._fees == {2: 20, 3: 30, 4: 40}
+
+
+async def test_fee_candidates_percentiles():
+    rpc = StandInRpc(fees=_fee_samples(*range(0, 100_000, 1_000)))
+    estimator = PriorityFeeEstimator(RPC_URL, rpc.client())
+    await estimator.refresh()
+
+    assert estimator.candidates() == [50_000, 75_000, 95_000]
+
+
+async def test_fee_candidates_stay_distinct_above_floor():
+    rpc = StandInRpc(fees=_fee_samples(0, 0, 0, 0))
+    estimator = PriorityFeeEstimator(RPC_URL, rpc.client())
+    await estimator.refresh()
+
+    assert estimator.candidates() == [
+        MIN_PRIORITY_FEE,
+        2 * MIN_PRIORITY_FEE,
+        4 * MIN_PRIORITY_FEE,
+    ]
+
+
+async def test_fee_estimator_samples_tracked_accounts():
+    rpc = StandInRpc(fees=_fee_samples(5))
+    estimator = PriorityFeeEstimator(RPC_URL, rpc.client())
+    await estimator.refresh()
+
+    estimator.track(["Acct1", "Acct2"])
+    rpc.fees = _fee_samples(7_000, first_slot=50)
+    await estimator.refresh()
+
+    assert rpc.params[-1] == [["Acct1", "Acct2"]]
+    assert estimator._fees == {50: 7_000}  # network-wide samples dropped
+
+
+# ---------------------------------------------------------------------------
+# BlockhashCache
+# ---------------------------------------------------------------------------
+
+async def test_blockhash_cache_refetches_only_when_stale():
+    rpc = StandInRpc()
+    cache = BlockhashCache(RPC_URL, rpc.client())
+
+    first = await cache.get()
+    assert await cache.get() == first
+    assert rpc.methods.count("getLatestBlockhash") == 1
+
+    cache._fetched_at -= executor.BLOCKHASH_MAX_AGE_SECONDS + 1
+    assert await cache.get() != first
+    assert rpc.methods.count("getLatestBlockhash") == 2
+
+
+# ---------------------------------------------------------------------------
+# plan_rebalance
+# ---------------------------------------------------------------------------
+
+def test_plan_add_collateral():
+    plan = plan_rebalance(_position("W"), "add_collateral", 250)
+    assert plan.input_mint == TOKEN_MINTS["USDC"]
+    assert plan.output_mint == TOKEN_MINTS["SOL"]
+    assert (plan.amount, plan.swap_mode, plan.urgent) == (250_000_000, "ExactIn", False)
+
+
+def test_plan_repay_debt_is_exact_out_and_urgent_on_emergency():
+    position = _position("W", RiskLevel.EMERGENCY, account="Obligation")
+    plan = plan_rebalance(position, "repay_debt", 100.5)
+    assert plan.account == "Obligation"
+    assert plan.input_mint == TOKEN_MINTS["SOL"]
+    assert plan.output_mint == TOKEN_MINTS["USDC"]
+    assert (plan.amount, plan.swap_mode, plan.urgent) == (100_500_000, "ExactOut", True)
+
+
+def test_plan_accepts_unlisted_mint_addresses():
+    mint = str(Pubkey.new_unique())
+    position = _position("W", tokens_collateral=[mint], tokens_debt=[TOKEN_MINTS["USDT"]])
+
+    plan = plan_rebalance(position, "repay_debt", 5)
+
+    assert (plan.input_mint, plan.output_mint) == (mint, TOKEN_MINTS["USDT"])
+
+
+@pytest.mark.parametrize(
+    "overrides, action, message",
+    [
+        ({}, "full_unwind", "Unsupported action"),
+        ({"tokens_debt": ["SOL"]}, "repay_debt", "stablecoin"),
+        ({"tokens_collateral": ["NOTATOKEN"]}, "add_collateral", "Unknown token"),
+        ({"demo": True}, "repay_debt", "demo data"),
+        ({"health_factor": None, "risk_level": None}, "repay_debt", "unpriced"),
+    ],
+)
+def test_plan_rejects(overrides, action, message):
+    with pytest.raises(ValueError, match=message):
+        plan_rebalance(_position("W", **overrides), action, 10)
+
+
+# ---------------------------------------------------------------------------
+# RebalancePipeline.execute
+# ---------------------------------------------------------------------------
+
+async def _pipeline(rpc: StandInRpc, **kwargs) -> RebalancePipeline:
+    pipeline = RebalancePipeline(RPC_URL, client=rpc.client(), **kwargs)
+    await pipeline.fees.refresh()
+    return pipeline
+
+
+async def test_execute_urgent_picks_highest_passing_fee():
+    rpc = StandInRpc(fees=_fee_samples(0, 0), failing_fees={4 * MIN_PRIORITY_FEE})
+    pipeline = await _pipeline(rpc)
+    position = _position(str(Pubkey.new_unique()), RiskLevel.EMERGENCY)
+    plan = plan_rebalance(position, "repay_debt", 10)
+
+    result = await pipeline.execute(plan)
+
+    assert [c["ok"] for c in result["candidates"]] == [True, True, False]
+    assert result["selected_priority_fee"] == 2 * MIN_PRIORITY_FEE
+    assert rpc.methods.count("simulateTransaction") == 3
+    assert "sendTransaction" not in rpc.methods  # dry run
+    assert result["protective_leg"] is False
+    assert set(result["timings_ms"]) == {
+        "pre_pipeline", "build", "simulate", "trigger_to_decision"
+    }
+
+
+async def test_execute_non_urgent_picks_lowest_passing_fee():
+    rpc = StandInRpc(fees=_fee_samples(0, 0), failing_fees={MIN_PRIORITY_FEE})
+    pipeline = await _pipeline(rpc)
+    plan = plan_rebalance(_position(str(Pubkey.new_unique())), "add_collateral", 10)
+
+    result = await pipeline.execute(plan)
+
+    assert result["selected_priority_fee"] == 2 * MIN_PRIORITY_FEE
+
+
+async def test_first_execute_uses_fees_sampled_for_its_own_accounts():
+    rpc = StandInRpc(
+        fees=_fee_samples(0, 0),
+        account_fees=_fee_samples(*range(0, 100_000, 1_000), first_slot=50),
+    )
+    pipeline = await _pipeline(rpc)  # warm window: network-wide zeros
+    wallet = str(Pubkey.new_unique())
+
+    result = await pipeline.execute(plan_rebalance(_position(wallet), "add_collateral", 10))
+
+    sample = max(i for i, m in enumerate(rpc.methods) if m == "getRecentPrioritizationFees")
+    assert rpc.params[sample] == [[str(rpc.swap_account)]]
+    assert sample < rpc.methods.index("simulateTransaction")
+    assert [c["priority_fee_micro_lamports"] for c in result["candidates"]] == [
+        50_000, 75_000, 95_000
+    ]
+
+
+async def test_execute_skips_fee_sample_when_accounts_already_tracked():
+    rpc = StandInRpc()
+    pipeline = await _pipeline(rpc)
+    plan = plan_rebalance(_position(str(Pubkey.new_unique())), "add_collateral", 10)
+
+    await pipeline.execute(plan)
+    await pipeline.execute(plan)
+
+    assert rpc.methods.count("getRecentPrioritizationFees") == 2  # warm-up + first
+
+
+async def test_failed_fee_sample_falls_back_to_floor_levels():
+    rpc = StandInRpc(fees=_fee_samples(90_000, 90_000))
+    estimator = PriorityFeeEstimator(RPC_URL, rpc.client())
+    await estimator.refresh()
+
+    async def unavailable(*args, **kwargs):
+        raise httpx.ConnectError("down")
+
+    estimator.refresh = unavailable
+    await estimator.sample(["Acct1"])
+
+    assert estimator.candidates() == [
+        MIN_PRIORITY_FEE,
+        2 * MIN_PRIORITY_FEE,
+        4 * MIN_PRIORITY_FEE,
+    ]
+
+
+async def test_execute_reports_when_no_candidate_passes():
+    fees = {MIN_PRIORITY_FEE, 2 * MIN_PRIORITY_FEE, 4 * MIN_PRIORITY_FEE}
+    rpc = StandInRpc(failing_fees=fees)
+    pipeline = await _pipeline(rpc)
+    plan = plan_rebalance(_position(str(Pubkey.new_unique())), "add_collateral", 10)
+
+    result = await pipeline.execute(plan)
+
+    assert result["selected_priority_fee"] is None
+    assert result["error"] == "No fee candidate simulated successfully"
+    assert "trigger_to_send" not in result["timings_ms"]
+
+
+async def test_execute_rejects_signer_wallet_mismatch():
+    rpc = StandInRpc()
+    pipeline = await _pipeline(rpc, signer=Keypair())
+    plan = plan_rebalance(_position(str(Pubkey.new_unique())), "add_collateral", 10)
+
+    with pytest.raises(RuntimeError, match="Signer does not match"):
+        await pipeline.execute(plan)
+    assert "simulateTransaction" not in rpc.methods
+
+
+async def test_live_execute_refuses_swap_only_rebalance():
+    signer = Keypair()
+    rpc = StandInRpc()
+    pipeline = await _pipeline(rpc, signer=signer, live=True)
+    plan = plan_rebalance(_position(str(signer.pubkey())), "repay_debt", 10)
+
+    with pytest.raises(RuntimeError, match="swap-only"):
+        await pipeline.execute(plan)
+    assert "sendTransaction" not in rpc.methods
+
+
+async def test_live_execute_sends_swap_with_protocol_leg():
+    signer = Keypair()
+    rpc = StandInRpc()
+    pipeline = await _pipeline(rpc, signer=signer, live=True)
+    plan = plan_rebalance(_position(str(signer.pubkey())), "repay_debt", 10)
+    repay = Instruction(
+        Pubkey.new_unique(), b"repay", [AccountMeta(signer.pubkey(), True, True)]
+    )
+
+    async def protocol_leg():
+        return [repay]
+
+    result = await pipeline.execute(plan, protocol_instructions=protocol_leg())
+
+    assert result["signature"] == "5ig"
+    assert result["protective_leg"] is True
+    sent = VersionedTransaction.from_bytes(rpc.sent[0])
+    assert len(sent.message.instructions) == 4  # limit, price, swap, repay
+    assert {"send", "trigger_to_send"} <= set(result["timings_ms"])
+    assert "trigger_to_decision" not in result["timings_ms"]
@@ -0,0 +1,582 @@
+"""Tests for sliced account fetches and protocol decoders in solana_client."""
+
+import base64
+
+import pytest
+import zstandard
+from solders.pubkey import Pubkey
+from solders.token.associated import get_associated_token_address
+
+import solana_client
+from models import RiskLevel
+from solana_client import (
+    RESERVE_REFRESH_SLOTS,
+    TOKEN_MINTS,
+    AccountLayout,
+    AccountView,
+    ReserveInfo,
+    ReserveRegistry,
+)
+
+
+LAYOUT = AccountLayout(size=100, sections={"a": (10, 4), "b": (40, 8)})
+
+
+def _encode(data: bytes) -> list[str]:
+    return [base64.b64encode(data).decode(), "base64"]
+
+
+class StubRpc:
+    """Stand-in for ``solana_client.rpc_call`` that records every request."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls: list[tuple[str, list]] = []
+
+    async def __call__(self, rpc_url, method, params, client=None):
+        self.calls.append((method, params))
+        response = self.responses.pop(0)
+        return response(method, params) if callable(response) else response
+
+
+@pytest.fixture(autouse=True)
+def _reset_zstd_state():
+    solana_client._ZSTD_UNSUPPORTED.clear()
+    yield
+    solana_client._ZSTD_UNSUPPORTED.clear()
+
+
+# ---------------------------------------------------------------------------
+# Layouts and views
+# ---------------------------------------------------------------------------
+
+def test_data_slice_covers_requested_sections():
+    assert LAYOUT.data_slice() == {"offset": 10, "length": 38}
+    assert LAYOUT.data_slice(["b"]) == {"offset": 40, "length": 8}
+
+
+def test_account_view_reads_by_full_account_offset():
+    data = bytes(range(38))
+    view = AccountView("X", data, base_offset=10)
+    assert view.read(12, 2) == bytes([2, 3])
+    assert view.u8(47) == 37
+    with pytest.raises(ValueError):
+        view.read(5, 2)
+    with pytest.raises(ValueError):
+        view.read(46, 4)
+
+
+def test_account_view_whole_account():
+    data = bytearray(100)
+    data[40:48] = (123).to_bytes(8, "little")
+    assert AccountView("X", bytes(data)).uint(40, 8) == 123
+
+
+def test_decode_account_data_zstd():
+    raw = bytes(range(200))
+    compressed = zstandard.ZstdCompressor().compress(raw)
+    payload = [base64.b64encode(compressed).decode(), "base64+zstd"]
+    assert solana_client._decode_account_data(payload) == raw
+    assert solana_client._decode_account_data(_encode(raw)) == raw
+
+
+# ---------------------------------------------------------------------------
+# Sliced fetches
+# ---------------------------------------------------------------------------
+
+def _program_accounts(data: bytes, slot: int = 7) -> dict:
+    return {
+        "result": {
+            "context": {"slot": slot},
+            "value": [{"pubkey": "A", "account": {"data": _encode(data)}}],
+        }
+    }
+
+
+async def test_program_accounts_sliced_request(monkeypatch):
+    rpc = StubRpc(_program_accounts(bytes(8)))
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+
+    slot, views = await solana_client.get_program_accounts_sliced(
+        "url", "Prog", LAYOUT, filters=[{"memcmp": {"offset": 0, "bytes": "W"}}],
+        sections=["b"],
+    )
+
+    config = rpc.calls[0][1][1]
+    assert config["encoding"] == "base64+zstd"
+    assert config["dataSlice"] == {"offset": 40, "length": 8}
+    assert config["filters"][0] == {"dataSize": 100}
+    assert slot == 7
+    assert views[0].base_offset == 40
+
+
+async def test_program_accounts_whole_account_response(monkeypatch):
+    data = bytearray(100)
+    data[40] = 9
+    monkeypatch.setattr(solana_client, "rpc_call", StubRpc(_program_accounts(bytes(data))))
+
+    _, views = await solana_client.get_program_accounts_sliced(
+        "url", "Prog", LAYOUT, filters=[], sections=["b"]
+    )
+
+    assert views[0].base_offset == 0
+    assert views[0].u8(40) == 9
+
+
+async def test_encoding_rejection_falls_back_and_is_remembered(monkeypatch):
+    rejected = {"error": {"code": -32602, "message": "unsupported encoding"}}
+    rpc = StubRpc(rejected, _program_accounts(bytes(8)), _program_accounts(bytes(8)))
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+
+    await solana_client.get_program_accounts_sliced("url", "P", LAYOUT, [], ["b"])
+    await solana_client.get_program_accounts_sliced("url", "P", LAYOUT, [], ["b"])
+
+    encodings = [params[1]["encoding"] for _, params in rpc.calls]
+    assert encodings == ["base64+zstd", "base64", "base64"]
+    assert "url" in solana_client._ZSTD_UNSUPPORTED
+
+
+async def test_invalid_params_on_both_attempts_do_not_disable_zstd(monkeypatch):
+    invalid = {"error": {"code": -32602, "message": "Invalid params: bad filter"}}
+    rpc = StubRpc(invalid, invalid)
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+
+    with pytest.raises(RuntimeError):
+        await solana_client.get_program_accounts_sliced("url", "P", LAYOUT, [], ["b"])
+
+    encodings = [params[1]["encoding"] for _, params in rpc.calls]
+    assert encodings == ["base64+zstd", "base64"]
+    assert solana_client._ZSTD_UNSUPPORTED == set()
+
+
+async def test_other_errors_do_not_disable_zstd(monkeypatch):
+    rate_limited = {"error": {"code": 429, "message": "Too many requests"}}
+    rpc = StubRpc(rate_limited)
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+
+    with pytest.raises(RuntimeError):
+        await solana_client.get_program_accounts_sliced("url", "P", LAYOUT, [], ["b"])
+
+    assert len(rpc.calls) == 1
+    assert "url" not in solana_client._ZSTD_UNSUPPORTED
+
+
+# ---------------------------------------------------------------------------
+# Fixture builders
+# ---------------------------------------------------------------------------
+
+SF = 1 << 60
+WAD = 10**18
+I80F48 = 1 << 48
+
+
+def _key() -> tuple[str, bytes]:
+    pubkey = Pubkey.new_unique()
+    return str(pubkey), bytes(pubkey)
+
+
+def _put(buf: bytearray, offset: int, value: int, length: int, signed=False) -> None:
+    buf[offset : offset + length] = value.to_bytes(length, "little", signed=signed)
+
+
+def _kamino_obligation(deposits, borrows) -> bytes:
+    """deposits: [(reserve, market_value)], borrows: [(reserve, rate, market_value)]."""
+    buf = bytearray(3344)
+    for i, (reserve, value) in enumerate(deposits):
+        offset = 96 + i * 136
+        buf[offset : offset + 32] = reserve
+        _put(buf, offset + 40, int(value * SF), 16)
+    for i, (reserve, rate, value) in enumerate(borrows):
+        offset = 1208 + i * 200
+        buf[offset : offset + 32] = reserve
+        _put(buf, offset + 32, int(rate * SF), 32)
+        _put(buf, offset + 104, int(value * SF), 16)
+    return bytes(buf)
+
+
+def _kamino_reserve(mint: bytes, threshold_pct: int, rate: float) -> bytes:
+    buf = bytearray(8624)
+    buf[128:160] = mint
+    _put(buf, 296, int(rate * SF), 32)
+    buf[4873] = threshold_pct
+    return bytes(buf)
+
+
+def _solend_obligation(deposits, borrows) -> bytes:
+    buf = bytearray(1300)
+    buf[202], buf[203] = len(deposits), len(borrows)
+    offset = 204
+    for reserve, value in deposits:
+        buf[offset : offset + 32] = reserve
+        _put(buf, offset + 40, int(value * WAD), 16)
+        offset += 88
+    for reserve, rate, value in borrows:
+        buf[offset : offset + 32] = reserve
+        _put(buf, offset + 32, int(rate * WAD), 16)
+        _put(buf, offset + 64, int(value * WAD), 16)
+        offset += 112
+    return bytes(buf)
+
+
+def _solend_reserve(mint: bytes, threshold_pct: int, rate: float) -> bytes:
+    buf = bytearray(619)
+    buf[42:74] = mint
+    _put(buf, 195, int(rate * WAD), 16)
+    buf[302] = threshold_pct
+    return bytes(buf)
+
+
+def _marginfi_account(balances) -> bytes:
+    """balances: [(bank, asset_shares, liability_shares)]."""
+    buf = bytearray(2312)
+    for i, (bank, assets, liabilities) in enumerate(balances):
+        offset = 72 + i * 104
+        buf[offset] = 1
+        buf[offset + 1 : offset + 33] = bank
+        _put(buf, offset + 40, int(assets * I80F48), 16, signed=True)
+        _put(buf, offset + 56, int(liabilities * I80F48), 16, signed=True)
+    return bytes(buf)
+
+
+def _marginfi_bank(mint: bytes, asset_value: float, liability_value: float) -> bytes:
+    buf = bytearray(1864)
+    buf[8:40] = mint
+    _put(buf, 80, int(asset_value * I80F48), 16, signed=True)
+    _put(buf, 96, int(liability_value * I80F48), 16, signed=True)
+    _put(buf, 312, int(0.9 * I80F48), 16, signed=True)
+    return bytes(buf)
+
+
+def _reserve(address: str, threshold: float = 0.8, rate: float = 1.0, **kw) -> ReserveInfo:
+    return ReserveInfo(
+        address, TOKEN_MINTS["SOL"], threshold, cumulative_borrow_rate=rate, **kw
+    )
+
+
+# ---------------------------------------------------------------------------
+# Decoders
+# ---------------------------------------------------------------------------
+
+SOL = bytes(Pubkey.from_string(TOKEN_MINTS["SOL"]))
+USDC = bytes(Pubkey.from_string(TOKEN_MINTS["USDC"]))
+
+
+def test_decode_kamino_reserve():
+    info = solana_client.decode_kamino_reserve(
+        AccountView("R", _kamino_reserve(SOL, 85, 1.25))
+    )
+    assert (info.mint, info.liquidation_threshold) == (TOKEN_MINTS["SOL"], 0.85)
+    assert info.cumulative_borrow_rate == pytest.approx(1.25)
+
+
+def test_decode_kamino_obligation_accrues_borrows():
+    (r1, r1_bytes), (r2, r2_bytes) = _key(), _key()
+    data = _kamino_obligation([(r1_bytes, 1000)], [(r2_bytes, 1.0, 500)])
+    view = AccountView("O", data)
+    reserves = {
+        r1: _reserve(r1, threshold=0.8),
+        r2: ReserveInfo(r2, TOKEN_MINTS["USDC"], 0.0, cumulative_borrow_rate=1.1),
+    }
+
+    assert solana_client.kamino_obligation_reserves(view) == [r1, r2]
+    position = solana_client.decode_kamino_obligation(view, "W", reserves)
+
+    assert (position.collateral_usd, position.debt_usd) == (1000.0, 550.0)
+    assert position.health_factor == pytest.approx(800 / 550, abs=1e-4)
+    assert position.risk_level == RiskLevel.WARNING
+    assert (position.tokens_collateral, position.tokens_debt) == (["SOL"], ["USDC"])
+
+
+def test_solend_entries_are_packed_after_lengths():
+    (r1, r1_bytes), (r2, r2_bytes), (r3, r3_bytes) = _key(), _key(), _key()
+    data = _solend_obligation([(r1_bytes, 1), (r2_bytes, 1)], [(r3_bytes, 1.0, 1)])
+    view = AccountView("O", data)
+
+    assert solana_client._solend_entries(view) == ([204, 292], [380])
+    assert solana_client.solend_obligation_reserves(view) == [r1, r2, r3]
+
+
+def test_decode_solend_reserve_and_obligation():
+    reserve = solana_client.decode_solend_reserve(
+        AccountView("R", _solend_reserve(USDC, 0, 1.2))
+    )
+    assert reserve.mint == TOKEN_MINTS["USDC"]
+    assert reserve.cumulative_borrow_rate == pytest.approx(1.2)
+
+    (r1, r1_bytes), (r2, r2_bytes) = _key(), _key()
+    view = AccountView("O", _solend_obligation([(r1_bytes, 300)], [(r2_bytes, 1.0, 100)]))
+    reserves = {r1: _reserve(r1, threshold=0.5), r2: reserve}
+    position = solana_client.decode_solend_obligation(view, "W", reserves)
+
+    assert (position.collateral_usd, position.debt_usd) == (300.0, 120.0)
+    assert position.health_factor == pytest.approx(150 / 120, abs=1e-4)
+    assert position.tokens_debt == ["USDC"]
+
+
+@pytest.mark.parametrize(
+    "build, decode",
+    [
+        (
+            lambda r1, r2: _kamino_obligation([(r1, 1000)], [(r2, 1.0, 500)]),
+            solana_client.decode_kamino_obligation,
+        ),
+        (
+            lambda r1, r2: _solend_obligation([(r1, 1000)], [(r2, 1.0, 500)]),
+            solana_client.decode_solend_obligation,
+        ),
+    ],
+)
+def test_decoders_refuse_partially_loaded_reserves(build, decode):
+    (r1, r1_bytes), (r2, r2_bytes) = _key(), _key()
+    view = AccountView("O", build(r1_bytes, r2_bytes))
+
+    # The borrow reserve is missing: valuing collateral alone would report
+    # a confident, far too healthy position.
+    with pytest.raises(ValueError, match=f"reserve {r2} could not be loaded"):
+        decode(view, "W", {r1: _reserve(r1)})
+
+
+def test_decode_marginfi_account_is_unpriced_and_skips_dust():
+    bank = solana_client.decode_marginfi_bank(
+        AccountView("B", _marginfi_bank(SOL, 1.5, 2.0))
+    )
+    assert bank.asset_share_value == pytest.approx(1.5)
+    assert bank.liability_share_value == pytest.approx(2.0)
+    assert bank.liquidation_threshold == pytest.approx(0.9)
+
+    (b1, b1_bytes), (b2, b2_bytes) = _key(), _key()
+    usdc_bank = _reserve(b2, 0.0)
+    usdc_bank.mint = TOKEN_MINTS["USDC"]
+    # b1: real collateral plus a 0.3-unit liability left over after repaying.
+    view = AccountView("A", _marginfi_account([(b1_bytes, 1e9, 0.15), (b2_bytes, 0, 5e6)]))
+    position = solana_client.decode_marginfi_account(view, "W", {b1: bank, b2: usdc_bank})
+
+    assert solana_client.marginfi_account_banks(view) == [b1, b2]
+    assert (position.tokens_collateral, position.tokens_debt) == (["SOL"], ["USDC"])
+    # No oracle prices: never reported as a zero health factor that looks healthy.
+    assert not position.priced and not position.demo
+    assert (position.health_factor, position.risk_level) == (None, None)
+    assert position.to_dict()["risk_level"] is None
+
+
+# ---------------------------------------------------------------------------
+# Reserve registry
+# ---------------------------------------------------------------------------
+
+def _multiple_accounts(accounts: dict[str, bytes], slot: int | None = 100):
+    def respond(method, params):
+        config = params[1]
+        start, length = config["dataSlice"]["offset"], config["dataSlice"]["length"]
+        value = [
+            {"data": _encode(accounts[a][start : start + length])} if a in accounts else None
+            for a in params[0]
+        ]
+        body = {"value": value}
+        if slot is not None:
+            body["context"] = {"slot": slot}
+        return {"result": body}
+
+    return respond
+
+
+def _solend_reserves(*keys: str) -> dict[str, bytes]:
+    return {key: _solend_reserve(USDC, 80, 1.0) for key in keys}
+
+
+def _registry() -> ReserveRegistry:
+    return ReserveRegistry(
+        solana_client.SOLEND_RESERVE_LAYOUT, solana_client.decode_solend_reserve
+    )
+
+
+async def test_registry_warm_cache_makes_no_rpcs(monkeypatch):
+    r1, r2 = _key()[0], _key()[0]
+    rpc = StubRpc(_multiple_accounts(_solend_reserves(r1, r2)))
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+    registry = _registry()
+
+    first = await registry.get_many("url", [r1, r2, r1], slot=100)
+    second = await registry.get_many("url", [r2, r1], slot=200)
+
+    assert [method for method, _ in rpc.calls] == ["getMultipleAccounts"]
+    assert rpc.calls[0][1][0] == [r1, r2]  # deduplicated, one bulk request
+    assert second[r1] is first[r1]
+
+
+async def test_registry_batches_by_request_limit(monkeypatch):
+    keys = [_key()[0] for _ in range(150)]
+    accounts = _solend_reserves(*keys)
+    rpc = StubRpc(_multiple_accounts(accounts), _multiple_accounts(accounts))
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+
+    reserves = await _registry().get_many("url", keys, slot=100)
+
+    assert [len(params[0]) for _, params in rpc.calls] == [100, 50]
+    assert len(reserves) == 150
+
+
+async def test_registry_refreshes_stale_reserves_in_place(monkeypatch):
+    r1 = _key()[0]
+    refreshed = {r1: _solend_reserve(USDC, 60, 1.3)}
+    rpc = StubRpc(
+        _multiple_accounts(_solend_reserves(r1)),
+        _multiple_accounts(refreshed, slot=100 + RESERVE_REFRESH_SLOTS + 1),
+    )
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+    registry = _registry()
+
+    first = (await registry.get_many("url", [r1], slot=100))[r1]
+    second = (await registry.get_many("url", [r1], slot=100 + RESERVE_REFRESH_SLOTS + 1))[r1]
+
+    assert len(rpc.calls) == 2
+    assert second is first
+    assert first.liquidation_threshold == 0.6
+    assert first.cumulative_borrow_rate == pytest.approx(1.3)
+
+
+async def test_registry_looks_up_slot_when_unknown(monkeypatch):
+    r1 = _key()[0]
+    rpc = StubRpc(
+        _multiple_accounts(_solend_reserves(r1)),
+        {"result": 100 + RESERVE_REFRESH_SLOTS + 1},  # getSlot
+        _multiple_accounts(_solend_reserves(r1)),
+    )
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+    registry = _registry()
+
+    await registry.get_many("url", [r1], slot=100)
+    await registry.get_many("url", [r1], slot=None)
+
+    assert [m for m, _ in rpc.calls] == [
+        "getMultipleAccounts", "getSlot", "getMultipleAccounts"
+    ]
+
+
+async def test_registry_without_any_slot_treats_reserves_as_stale(monkeypatch):
+    r1 = _key()[0]
+    no_slot = {"error": {"code": -32601, "message": "Method not found"}}
+    rpc = StubRpc(
+        no_slot,
+        _multiple_accounts(_solend_reserves(r1), slot=None),
+        no_slot,
+        _multiple_accounts(_solend_reserves(r1), slot=None),
+    )
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+    registry = _registry()
+
+    await registry.get_many("url", [r1], slot=None)
+    await registry.get_many("url", [r1], slot=None)
+
+    assert [m for m, _ in rpc.calls].count("getMultipleAccounts") == 2
+
+
+# ---------------------------------------------------------------------------
+# fetch_*_positions
+# ---------------------------------------------------------------------------
+
+async def test_fetch_kamino_positions_uses_real_layout_and_warm_cache(monkeypatch):
+    monkeypatch.setattr(solana_client, "KAMINO_RESERVES", ReserveRegistry(
+        solana_client.KAMINO_RESERVE_LAYOUT, solana_client.decode_kamino_reserve
+    ))
+    (r1, r1_bytes), (r2, r2_bytes) = _key(), _key()
+    obligation = _kamino_obligation([(r1_bytes, 1000)], [(r2_bytes, 1.0, 400)])
+    reserves = {r1: _kamino_reserve(SOL, 80, 1.0), r2: _kamino_reserve(USDC, 0, 1.0)}
+
+    def program_accounts(method, params):
+        config = params[1]
+        start, length = config["dataSlice"]["offset"], config["dataSlice"]["length"]
+        return _program_accounts(obligation[start : start + length], slot=500)
+
+    rpc = StubRpc(program_accounts, _multiple_accounts(reserves), program_accounts)
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+
+    first = await solana_client.fetch_kamino_positions("url", "Wallet")
+    second = await solana_client.fetch_kamino_positions("url", "Wallet")
+
+    filters = rpc.calls[0][1][1]["filters"]
+    assert filters == [
+        {"dataSize": 3344},
+        {"memcmp": {"offset": 64, "bytes": "Wallet"}},
+    ]
+    assert [m for m, _ in rpc.calls].count("getMultipleAccounts") == 1
+    assert first[0].health_factor == second[0].health_factor == 2.0
+    assert not first[0].demo
+
+
+async def test_fetch_with_unloadable_reserve_falls_back_to_demo_data(monkeypatch):
+    monkeypatch.setattr(solana_client, "SOLEND_RESERVES", _registry())
+    (r1, r1_bytes), (r2, r2_bytes) = _key(), _key()
+    obligation = _solend_obligation([(r1_bytes, 1000)], [(r2_bytes, 1.0, 500)])
+
+    def program_accounts(method, params):
+        config = params[1]
+        start, length = config["dataSlice"]["offset"], config["dataSlice"]["length"]
+        return _program_accounts(obligation[start : start + length])
+
+    # getMultipleAccounts returns null for the borrow reserve.
+    rpc = StubRpc(program_accounts, _multiple_accounts(_solend_reserves(r1)))
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+
+    positions = await solana_client.fetch_solend_positions("url", "Wallet")
+
+    assert positions[0].demo
+
+
+async def test_fetch_falls_back_to_marked_demo_data(monkeypatch):
+    rpc = StubRpc({"error": {"code": 429, "message": "Too many requests"}})
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+
+    positions = await solana_client.fetch_solend_positions("url", "Wallet")
+
+    assert positions[0].demo
+
+
+# ---------------------------------------------------------------------------
+# Solend repay encoder
+# ---------------------------------------------------------------------------
+
+async def test_solend_repay_instructions(monkeypatch):
+    monkeypatch.setattr(solana_client, "SOLEND_RESERVES", _registry())
+    (obligation, _), (r1, r1_bytes), (r2, r2_bytes) = _key(), _key(), _key()
+    (market, market_bytes), (supply, supply_bytes) = _key(), _key()
+    (pyth, pyth_bytes), (switchboard, switchboard_bytes) = _key(), _key()
+    wallet = Pubkey.new_unique()
+    reserve = bytearray(_solend_reserve(USDC, 80, 1.0))
+    reserve[10:42], reserve[75:107] = market_bytes, supply_bytes
+    reserve[107:139], reserve[139:171] = pyth_bytes, switchboard_bytes
+    accounts = {
+        obligation: _solend_obligation([(r1_bytes, 300)], [(r2_bytes, 1.0, 100)]),
+        r2: bytes(reserve),
+    }
+    rpc = StubRpc(*[_multiple_accounts(accounts)] * 3)
+    monkeypatch.setattr(solana_client, "rpc_call", rpc)
+
+    refresh, repay = await solana_client.solend_repay_instructions(
+        "url", obligation, str(wallet), TOKEN_MINTS["USDC"], 25_000_000
+    )
+
+    assert bytes(refresh.data) == bytes([3])
+    assert [str(m.pubkey) for m in refresh.accounts] == [r2, pyth, switchboard]
+    assert bytes(repay.data) == bytes([11]) + (25_000_000).to_bytes(8, "little")
+    source = get_associated_token_address(wallet, Pubkey.from_string(TOKEN_MINTS["USDC"]))
+    assert [str(m.pubkey) for m in repay.accounts] == [
+        str(source), supply, r2, obligation, market, str(wallet), solana_client.TOKEN_PROGRAM
+    ]
+    assert [m.is_signer for m in repay.accounts] == [False] * 5 + [True, False]
+    # Only the borrow reserve is loaded, not the deposit reserve.
+    assert rpc.calls[1][1][0] == [r2]
+
+
+async def test_solend_repay_instructions_need_a_matching_borrow(monkeypatch):
+    monkeypatch.setattr(solana_client, "SOLEND_RESERVES", _registry())
+    (obligation, _), (r1, r1_bytes) = _key(), _key()
+    accounts = {
+        obligation: _solend_obligation([], [(r1_bytes, 1.0, 100)]),
+        r1: _solend_reserve(SOL, 80, 1.0),
+    }
+    monkeypatch.setattr(solana_client, "rpc_call", StubRpc(*[_multiple_accounts(accounts)] * 2))
+
+    with pytest.raises(ValueError, match="no .* borrow"):
+        await solana_client.solend_repay_instructions(
+            "url", obligation, str(Pubkey.new_unique()), TOKEN_MINTS["USDC"], 1
+        )